@@ -1 +1,2 @@
 from . import llm
+from . import tokens
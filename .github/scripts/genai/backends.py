@@ -0,0 +1,197 @@
+from abc import ABC, abstractmethod
+from enum import Enum
+import hashlib
+import json
+import re
+from string import Template
+import time
+from typing import Iterator, List, Optional
+from google.genai import Client, types
+from . import tokens
+from ..utils import get_converted_enum, get_env_float_value, get_env_value, get_optional_env_value
+
+
+class LlmBackendType(Enum):
+    Vertex = "vertex"
+    Local = "local"
+
+
+class LlmBackend(ABC):
+    """
+        interface of llm provider. responses are sdk response types, so callers are same for all backends
+    """
+
+    @abstractmethod
+    def get_model_name(self) -> str:
+        pass
+
+    @abstractmethod
+    def generate_content(self, model: str, contents: str, config: types.GenerateContentConfigOrDict) -> types.GenerateContentResponse:
+        pass
+
+    @abstractmethod
+    def generate_content_stream(self, model: str, contents: str, config: types.GenerateContentConfigOrDict) -> Iterator[types.GenerateContentResponse]:
+        pass
+
+    @abstractmethod
+    def count_tokens(self, model: str, contents: str) -> int:
+        pass
+
+    def get_default_requests_per_minute(self) -> int:
+        """
+            request rate of llm rate limiter, when LLM_REQUESTS_PER_MINUTE env is not set. 0 is no request rate limit
+        """
+        return 60
+
+    def get_small_model_name(self) -> Optional[str]:
+        """
+            fast and cheap model for small prompts. None when it is not configured, then all prompts go to model of get_model_name
+        """
+        return None
+
+    def create_cached_content(self, model: str, contents: str, ttl_seconds: int) -> Optional[str]:
+        """
+            creates provider side context cache of contents and returns its name.
+            backends without context caching return None, so prompt is sent in full
+        """
+        return None
+
+    def delete_cached_content(self, name: str):
+        pass
+
+
+class VertexBackend(LlmBackend):
+    def __init__(self):
+        self.client = Client(
+            vertexai=True,
+            project=get_env_value("GCP_PROJECT"),
+            location=get_env_value("GCP_LOCATION")
+        )
+        self.model_name = get_env_value("GCP_MODEL_NAME")
+        self.small_model_name = get_optional_env_value("GCP_SMALL_MODEL_NAME")
+
+    def get_model_name(self):
+        return self.model_name
+
+    def get_small_model_name(self):
+        return self.small_model_name
+
+    def generate_content(self, model: str, contents: str, config: types.GenerateContentConfigOrDict):
+        return self.client.models.generate_content(model=model, contents=contents, config=config)
+
+    def generate_content_stream(self, model: str, contents: str, config: types.GenerateContentConfigOrDict):
+        return self.client.models.generate_content_stream(model=model, contents=contents, config=config)
+
+    def count_tokens(self, model: str, contents: str):
+        response = self.client.models.count_tokens(model=model, contents=contents)
+        return response.total_tokens if response.total_tokens is not None else 0
+
+    def create_cached_content(self, model: str, contents: str, ttl_seconds: int):
+        cached_content = self.client.caches.create(model=model, config=types.CreateCachedContentConfig(
+            contents=[contents],
+            ttl=f"{ttl_seconds}s",
+            display_name="release-notes-prompt-prefix"
+        ))
+        return cached_content.name
+
+    def delete_cached_content(self, name: str):
+        self.client.caches.delete(name=name)
+
+    def __repr__(self):
+        return f"VertexBackend(model={self.model_name}, client={self.client})"
+
+
+class LocalBackend(LlmBackend):
+    """
+        deterministic offline backend for benchmarking.
+        summarizer prompts are answered with one changelog entry per issue and its related issues, reducer prompts with unique partial entries.
+        latency before first token is LLM_LOCAL_LATENCY_SECONDS and output is generated at LLM_LOCAL_TOKENS_PER_SECOND (0 is instant).
+        there is no request rate limit by default, so benchmarks measure the pipeline instead of rate limiter waits.
+        LLM_MAX_CONCURRENCY still caps in flight calls
+    """
+    issue_start_regex = re.compile(r'\{"n":\d+,"t":')
+    issue_decoder = json.JSONDecoder()
+    change_template_regex = re.compile(r"`(- [^`]*\$TITLE[^`]*)`")
+
+    def __init__(self):
+        self.model_name = get_optional_env_value("LLM_LOCAL_MODEL_NAME", "local-fake")
+        self.small_model_name = get_optional_env_value("LLM_LOCAL_SMALL_MODEL_NAME")
+        self.latency_seconds = get_env_float_value("LLM_LOCAL_LATENCY_SECONDS", default_value=0)
+        self.tokens_per_second = get_env_float_value("LLM_LOCAL_TOKENS_PER_SECOND", default_value=0)
+
+    def get_model_name(self):
+        return self.model_name
+
+    def get_small_model_name(self):
+        return self.small_model_name
+
+    def get_default_requests_per_minute(self):
+        return 0
+
+    def get_summary_text(self, prompt: str):
+        change_template_match = self.change_template_regex.search(prompt)
+        change_template = Template(change_template_match.group(1) if change_template_match else "- $TITLE (#$ISSUE_NUMBERS)")
+        summary_lines: List[str] = []
+        for issue_match in self.issue_start_regex.finditer(prompt):
+            try:
+                prompt_issue, _ = self.issue_decoder.raw_decode(prompt, issue_match.start())
+            except json.JSONDecodeError:
+                continue
+            issue_numbers = [prompt_issue["n"]] + prompt_issue.get("r", [])
+            summary_lines.append(change_template.safe_substitute(TITLE=prompt_issue["t"], ISSUE_NUMBERS=", #".join(str(num) for num in issue_numbers)))
+
+        if len(summary_lines) == 0 and "### Partial Summaries:" in prompt:
+            partial_summaries = prompt.split("### Partial Summaries:", 1)[1]
+            summary_lines = list(dict.fromkeys(line.strip() for line in partial_summaries.splitlines() if line.strip().startswith("- ")))
+
+        if len(summary_lines) == 0:
+            prompt_hash = hashlib.sha256(prompt.encode("utf-8")).hexdigest()[:12]
+            summary_lines.append(f"- Generated summary {prompt_hash}")
+        return "\n".join(summary_lines)
+
+    def get_response(self, model: str, prompt: str, text: str, generated_text: str):
+        """
+            like provider stream, usage metadata counts all text generated so far
+        """
+        return types.GenerateContentResponse(
+            candidates=[types.Candidate(content=types.Content(role="model", parts=[types.Part(text=text)]))],
+            usage_metadata=types.GenerateContentResponseUsageMetadata(
+                prompt_token_count=tokens.estimate_tokens(prompt),
+                candidates_token_count=tokens.estimate_tokens(generated_text)
+            ),
+            model_version=model
+        )
+
+    def generate_content(self, model: str, contents: str, config: types.GenerateContentConfigOrDict):
+        text = self.get_summary_text(contents)
+        time.sleep(self.latency_seconds)
+        if self.tokens_per_second > 0:
+            time.sleep(tokens.estimate_tokens(text) / self.tokens_per_second)
+        return self.get_response(model, contents, text, text)
+
+    def generate_content_stream(self, model: str, contents: str, config: types.GenerateContentConfigOrDict):
+        text = self.get_summary_text(contents)
+        time.sleep(self.latency_seconds)
+        # fragments of about 8 tokens
+        fragment_chars = int(8 * tokens.DEFAULT_CHARS_PER_TOKEN)
+        for i in range(0, len(text), fragment_chars):
+            fragment = text[i:i+fragment_chars]
+            if self.tokens_per_second > 0:
+                time.sleep(tokens.estimate_tokens(fragment) / self.tokens_per_second)
+            yield self.get_response(model, contents, fragment, text[:i+fragment_chars])
+
+    def count_tokens(self, model: str, contents: str):
+        return tokens.estimate_tokens(contents)
+
+    def __repr__(self):
+        return f"LocalBackend(model={self.model_name}, latency={self.latency_seconds}s, tokens per second={self.tokens_per_second})"
+
+
+def create_backend() -> LlmBackend:
+    backend_value = get_optional_env_value("LLM_BACKEND", LlmBackendType.Vertex.value)
+    backend_type = get_converted_enum(LlmBackendType, backend_value)
+    if backend_type == LlmBackendType.Vertex:
+        return VertexBackend()
+    if backend_type == LlmBackendType.Local:
+        return LocalBackend()
+    raise ValueError(f"LLM_BACKEND env [{backend_value}] is not supported")
@@ -0,0 +1,99 @@
+from argparse import ArgumentParser
+import json
+from pathlib import Path
+from typing import Dict, List
+from google.genai import types
+from pydantic import BaseModel
+from .backends import LocalBackend
+
+
+BATCH_UNIT_LABEL = "unit_id"
+
+
+class BatchRequestModel(BaseModel):
+    unit_id: str
+    prompt: str
+
+
+def get_batch_request_dict(unit_id: str, prompt: str, generation_config: types.GenerateContentConfig):
+    """
+        one line of vertex batch prediction input. unit id is carried in request labels, the labels are echoed in the output line
+    """
+    config_dict = generation_config.model_dump(mode="json", exclude_none=True, by_alias=True)
+    safety_settings = config_dict.pop("safetySettings", None)
+    request_dict: Dict = {
+        "contents": [{"role": "user", "parts": [{"text": prompt}]}],
+        "generationConfig": config_dict,
+        "labels": {BATCH_UNIT_LABEL: unit_id}
+    }
+    if safety_settings is not None:
+        request_dict["safetySettings"] = safety_settings
+    return {"request": request_dict}
+
+
+def write_batch_requests(request_path: Path, batch_requests: List[BatchRequestModel], generation_config: types.GenerateContentConfig):
+    request_path.parent.mkdir(parents=True, exist_ok=True)
+    with open(request_path, mode="w", encoding="utf-8") as f:
+        for batch_request in batch_requests:
+            request_dict = get_batch_request_dict(batch_request.unit_id, batch_request.prompt, generation_config)
+            f.write(json.dumps(request_dict, ensure_ascii=False) + "\n")
+    print(f"{len(batch_requests)} batch requests are written to {request_path}")
+
+
+def read_batch_responses(response_path: Path) -> Dict[str, str]:
+    """
+        returns response text by unit id. failed lines are skipped with log, so missing units can be handled by caller
+    """
+    response_texts: Dict[str, str] = {}
+    with open(response_path, mode="r", encoding="utf-8") as f:
+        for line_number, line in enumerate(f, start=1):
+            if len(line.strip()) == 0:
+                continue
+            response_line = json.loads(line)
+            unit_id = response_line.get("request", {}).get("labels", {}).get(BATCH_UNIT_LABEL)
+            if unit_id is None:
+                print(f"batch response line {line_number} has no unit id, skipping")
+                continue
+            if response_line.get("response") is None:
+                print(f"batch response of unit [{unit_id}] has failed with status [{response_line.get("status")}], skipping")
+                continue
+            response = types.GenerateContentResponse.model_validate(response_line["response"])
+            response_texts[unit_id] = response.text.strip() if response.text is not None else ""
+    print(f"read {len(response_texts)} batch responses from {response_path}")
+    return response_texts
+
+
+def convert_batch_locally(request_path: Path, response_path: Path):
+    """
+        local stand-in of batch prediction job. answers every request line with local backend into output format of provider
+    """
+    backend = LocalBackend()
+    response_path.parent.mkdir(parents=True, exist_ok=True)
+    line_count = 0
+    with open(request_path, mode="r", encoding="utf-8") as request_file, open(response_path, mode="w", encoding="utf-8") as response_file:
+        for line in request_file:
+            if len(line.strip()) == 0:
+                continue
+            request_line = json.loads(line)
+            prompt = "".join(part.get("text", "") for content in request_line["request"]["contents"] for part in content["parts"])
+            response = backend.generate_content(model=backend.get_model_name(), contents=prompt, config=request_line["request"].get("generationConfig"))
+            response_line = {
+                "status": "",
+                "request": request_line["request"],
+                "response": response.model_dump(mode="json", exclude_none=True, by_alias=True)
+            }
+            response_file.write(json.dumps(response_line, ensure_ascii=False) + "\n")
+            line_count += 1
+    print(f"{line_count} batch responses are written to {response_path}")
+
+
+if __name__ == "__main__":
+    """
+    local stand-in of batch prediction job,
+    python -m scripts.genai.batch --requests ../dist/batch/requests.jsonl --responses ../dist/batch/responses.jsonl
+    """
+    parser = ArgumentParser(description="Convert batch request jsonl to response jsonl with local llm backend")
+    parser.add_argument("--requests", required=True, help="[Required] path of batch request jsonl")
+    parser.add_argument("--responses", required=True, help="[Required] path of batch response jsonl to write")
+    args = parser.parse_args()
+    convert_batch_locally(Path(args.requests), Path(args.responses))
@@ -0,0 +1,61 @@
+import hashlib
+from threading import Lock
+from typing import Dict, Optional
+from .backends import LlmBackend
+from . import tokens
+from ..utils import get_env_bool_value, get_env_int_value
+
+
+# cache name by hash of model and prompt prefix. None is kept when cache is not created, so creation is attempted once per run
+context_cache_names: Dict[str, Optional[str]] = {}
+context_cache_lock = Lock()
+
+
+def get_context_cache_key(model_name: str, prompt_prefix: str):
+    return hashlib.sha256(f"{model_name}\n{prompt_prefix}".encode("utf-8")).hexdigest()
+
+
+def get_cached_content_name(llm: LlmBackend, model_name: str, prompt_prefix: str) -> Optional[str]:
+    """
+        returns name of provider context cache of prompt prefix, created on first call of run.
+        returns None when disabled by LLM_CONTEXT_CACHE_ENABLED env, when prefix is smaller than LLM_CONTEXT_CACHE_MIN_TOKENS,
+        when backend doesnt support it, or when creation fails.
+        default summarizer prefix is below provider minimum, so caching is dormant until the prefix grows
+    """
+    if not get_env_bool_value("LLM_CONTEXT_CACHE_ENABLED", default_value=True):
+        return None
+    cache_key = get_context_cache_key(model_name, prompt_prefix)
+    with context_cache_lock:
+        if cache_key in context_cache_names:
+            return context_cache_names[cache_key]
+
+        cache_name: Optional[str] = None
+        # provider rejects context cache smaller than its minimum tokens
+        min_tokens = get_env_int_value("LLM_CONTEXT_CACHE_MIN_TOKENS", default_value=1024, min_value=0)
+        prefix_tokens = tokens.estimate_tokens(prompt_prefix)
+        if prefix_tokens < min_tokens:
+            print(f"prompt prefix of {prefix_tokens} estimated tokens is below context cache minimum of {min_tokens} tokens, "
+                  "context cache is not used and full prompts are sent")
+        else:
+            try:
+                cache_name = llm.create_cached_content(model=model_name, contents=prompt_prefix,
+                                                       ttl_seconds=get_env_int_value("LLM_CONTEXT_CACHE_TTL_SECONDS", default_value=3600))
+                print(f"context cache of prompt prefix is [{cache_name}]")
+            except Exception as e:
+                print(f"context cache creation failed, sending full prompts. error: {e}")
+        context_cache_names[cache_key] = cache_name
+        return cache_name
+
+
+def delete_context_caches(llm: LlmBackend):
+    """
+        deletes context caches created in run, instead of waiting for ttl expiry
+    """
+    with context_cache_lock:
+        cache_names = [cache_name for cache_name in context_cache_names.values() if cache_name is not None]
+        context_cache_names.clear()
+    for cache_name in cache_names:
+        try:
+            llm.delete_cached_content(cache_name)
+        except Exception as e:
+            print(f"context cache [{cache_name}] deletion failed. error: {e}")
@@ -0,0 +1,191 @@
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from threading import Event, Lock
+import time
+from typing import Callable, Deque, Dict, Optional, TypeVar
+from pydantic import BaseModel
+from ..utils import get_env_bool_value, get_env_float_value, get_env_int_value, tracing
+
+
+# latencies kept per prompt size bucket, older ones are dropped
+LATENCY_HISTORY_SIZE = 200
+
+# Result Type
+RT = TypeVar("RT")
+
+
+class HedgeStatsModel(BaseModel):
+    calls: int = 0
+    hedged: int = 0
+    hedge_wins: int = 0
+    saved_seconds: float = 0
+
+
+def get_size_bucket(estimated_tokens: int):
+    """
+        power of 2 buckets of estimated prompt tokens, below 1024 tokens is bucket 0
+    """
+    return max(0, estimated_tokens.bit_length() - 10)
+
+
+class RequestHedger:
+    """
+        sends a duplicate request, when a call has not returned by the observed latency percentile of its prompt size bucket.
+        latency is measured from start of the call, so time waiting for a worker thread doesnt count towards hedge delay.
+        first successful response wins, the other is cancelled if not started, otherwise its result is ignored.
+        duplicates are capped to max ratio of calls. no hedging until a bucket has min samples.
+        call is expected to be already admitted by llm rate limiter, so latencies dont include local throttling
+    """
+
+    def __init__(self, percentile: float, max_ratio: float, min_samples: int, min_delay_seconds: float, max_workers: int):
+        self.percentile = percentile
+        self.max_ratio = max_ratio
+        self.min_samples = min_samples
+        self.min_delay_seconds = min_delay_seconds
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="llm-hedge")
+        self.latencies: Dict[int, Deque[float]] = {}
+        self.stats = HedgeStatsModel()
+        self.lock = Lock()
+
+    def record_latency(self, size_bucket: int, latency_seconds: float):
+        with self.lock:
+            self.latencies.setdefault(size_bucket, deque(maxlen=LATENCY_HISTORY_SIZE)).append(latency_seconds)
+
+    def get_hedge_delay(self, size_bucket: int) -> Optional[float]:
+        with self.lock:
+            bucket_latencies = sorted(self.latencies.get(size_bucket, []))
+        if len(bucket_latencies) < self.min_samples:
+            return None
+        percentile_latency = bucket_latencies[min(len(bucket_latencies) - 1, int(self.percentile * len(bucket_latencies)))]
+        return max(self.min_delay_seconds, percentile_latency)
+
+    def try_reserve_hedge(self):
+        with self.lock:
+            if self.stats.hedged + 1 > self.max_ratio * self.stats.calls:
+                return False
+            self.stats.hedged += 1
+            return True
+
+    def cancel_hedge_reservation(self):
+        with self.lock:
+            self.stats.hedged -= 1
+
+    def submit_timed(self, call: Callable[[], RT], size_bucket: int, on_latency: Optional[Callable[[float], None]] = None,
+                     started: Optional[Event] = None) -> Future:
+        """
+            call runs on hedge worker thread with span of submitting thread, so span attributes like retries are kept.
+            started event is set when worker thread begins the call
+        """
+        caller_span_attributes = tracing.get_active_span_attributes()
+
+        def timed_call():
+            start_time = time.perf_counter()
+            if started is not None:
+                started.set()
+            with tracing.attached_span(caller_span_attributes):
+                result = call()
+            latency_seconds = time.perf_counter() - start_time
+            self.record_latency(size_bucket, latency_seconds)
+            if on_latency is not None:
+                on_latency(latency_seconds)
+            return result
+        return self.executor.submit(timed_call)
+
+    def call(self, call: Callable[[], RT], estimated_tokens: int, try_admit_hedge: Optional[Callable[[], bool]] = None,
+             release_hedge: Optional[Callable[[], None]] = None) -> RT:
+        """
+            duplicate request is sent only when try_admit_hedge admits it, so hedging doesnt add load while client is throttled.
+            release_hedge is called once admitted duplicate completes or is cancelled
+        """
+        size_bucket = get_size_bucket(estimated_tokens)
+        with self.lock:
+            self.stats.calls += 1
+        hedge_delay = self.get_hedge_delay(size_bucket)
+        primary_started = Event()
+        hedge_state = {"won_at": None}
+
+        def on_primary_latency(primary_latency: float):
+            # latency saved is known only when the losing primary call completes
+            with self.lock:
+                if hedge_state["won_at"] is not None:
+                    self.stats.saved_seconds += max(0.0, primary_latency - hedge_state["won_at"])
+
+        def on_hedge_latency(_: float):
+            with self.lock:
+                if not primary_future.done():
+                    hedge_state["won_at"] = time.perf_counter() - primary_start_time
+
+        primary_future = self.submit_timed(call, size_bucket, on_primary_latency, primary_started)
+        if hedge_delay is None:
+            return primary_future.result()
+        # hedge delay counts from start of primary call, queue time of hedge pool is not part of observed latencies
+        primary_started.wait()
+        primary_start_time = time.perf_counter()
+        done_futures, _ = wait([primary_future], timeout=hedge_delay)
+        if len(done_futures) > 0 or not self.try_reserve_hedge():
+            return primary_future.result()
+        if try_admit_hedge is not None and not try_admit_hedge():
+            self.cancel_hedge_reservation()
+            print(f"llm call has not returned in {hedge_delay:.2f} seconds, but rate limiter has no spare capacity for hedged request")
+            return primary_future.result()
+
+        def hedge_call():
+            try:
+                return call()
+            finally:
+                if release_hedge is not None:
+                    release_hedge()
+
+        print(f"llm call has not returned in {hedge_delay:.2f} seconds, sending hedged request")
+        tracing.add_span_attributes(hedged=True)
+        hedge_future = self.submit_timed(hedge_call, size_bucket, on_hedge_latency)
+        pending_futures = {primary_future, hedge_future}
+        while True:
+            done_futures, pending_futures = wait(pending_futures, return_when=FIRST_COMPLETED)
+            # when both complete in same wait, successful one wins over failed one, primary wins a tie
+            ordered_done_futures = sorted(done_futures, key=lambda future: (future.exception() is not None, future is not primary_future))
+            winner_future = ordered_done_futures[0]
+            # failed request waits for the other one, the error is raised only when both fail
+            if winner_future.exception() is None or len(pending_futures) == 0:
+                break
+        for pending_future in pending_futures:
+            # cancelled duplicate never runs, so its admission is released here
+            if pending_future.cancel() and pending_future is hedge_future and release_hedge is not None:
+                release_hedge()
+        if winner_future is hedge_future and winner_future.exception() is None:
+            with self.lock:
+                self.stats.hedge_wins += 1
+            tracing.add_span_attributes(hedge_won=True)
+        return winner_future.result()
+
+    def print_stats(self):
+        with self.lock:
+            hedge_rate = self.stats.hedged / self.stats.calls if self.stats.calls > 0 else 0
+            print(f"llm request hedging: calls={self.stats.calls}, hedged={self.stats.hedged} ({hedge_rate:.1%}), "
+                  f"hedge wins={self.stats.hedge_wins}, latency saved={self.stats.saved_seconds:.2f} seconds")
+
+
+request_hedger: Optional[RequestHedger] = None
+request_hedger_lock = Lock()
+
+
+def get_request_hedger() -> Optional[RequestHedger]:
+    """
+        returns None when hedging is disabled by LLM_HEDGE_ENABLED env, which is default
+    """
+    global request_hedger
+    if not get_env_bool_value("LLM_HEDGE_ENABLED", default_value=False):
+        return None
+    with request_hedger_lock:
+        if request_hedger is None:
+            request_hedger = RequestHedger(percentile=get_env_float_value("LLM_HEDGE_PERCENTILE", default_value=0.9),
+                                           max_ratio=get_env_float_value("LLM_HEDGE_MAX_RATIO", default_value=0.1),
+                                           min_samples=get_env_int_value("LLM_HEDGE_MIN_SAMPLES", default_value=10),
+                                           min_delay_seconds=get_env_float_value("LLM_HEDGE_MIN_DELAY_SECONDS", default_value=1),
+                                           max_workers=get_env_int_value("LLM_HEDGE_MAX_WORKERS", default_value=16))
+    return request_hedger
+
+
+def print_stats():
+    if request_hedger is not None:
+        request_hedger.print_stats()
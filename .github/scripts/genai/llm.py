@@ -1,36 +1,146 @@
-from typing import Dict, List, Optional
-from ..utils import get_env_value
+from threading import Lock
+import time
+from typing import Iterator, List, Optional, Tuple
+from . import context_cache, hedging, model_routing, rate_limit, response_cache, tokens
+from .backends import LlmBackend, create_backend
+from .model_routing import ModelRoute
 from google.genai import types
-from google.genai import Client
+from pydantic import BaseModel
+from ..utils import tracing
 
-# Init Vertex AI
-get_env_value("GCP_PROJECT")
-get_env_value("GCP_LOCATION")
-get_env_value("GCP_MODEL_NAME")
 
-llm_client: Optional[Client] = None
+llm_backend: Optional[LlmBackend] = None
+llm_backend_lock = Lock()
 
 
 def get_llm(debug_log: bool = False):
-    global llm_client
-    if llm_client is None:
-        llm_client = Client(
-            vertexai=True,
-            project=get_env_value("GCP_PROJECT"),
-            location=get_env_value("GCP_LOCATION")
-        )
-
-        if debug_log:
-            print("llm instance =", llm_client)
-            print("-" * 40)
+    """
+        backend is selected by LLM_BACKEND env. default is vertex
+    """
+    global llm_backend
+    # backend is shared by llm worker threads
+    with llm_backend_lock:
+        if llm_backend is None:
+            llm_backend = create_backend()
+
+            if debug_log:
+                print("llm instance =", llm_backend)
+                print("-" * 40)
+
+    return llm_backend
+
+
+def get_model_name():
+    return get_llm().get_model_name()
+
+
+def get_rate_limiter():
+    return rate_limit.get_rate_limiter(get_llm().get_default_requests_per_minute())
+
+
+def print_stats():
+    response_cache.print_cache_stats()
+    rate_limit.get_rate_limiter().print_stats()
+    hedging.print_stats()
+    model_routing.print_route_stats()
+
+
+def clear_context_caches():
+    if llm_backend is not None:
+        context_cache.delete_context_caches(llm_backend)
+
+
+def count_tokens(text: str):
+    llm = get_llm()
+    return llm.count_tokens(model=llm.get_model_name(), contents=text)
+
+
+def get_generation_config(temperature: Optional[float] = None):
+    return types.GenerateContentConfig(
+        temperature=temperature,
+        safety_settings=[
+            types.SafetySetting(
+                category=types.HarmCategory.HARM_CATEGORY_HATE_SPEECH,
+                threshold=types.HarmBlockThreshold.BLOCK_ONLY_HIGH
+            )
+        ]
+    )
+
+
+def get_response_cache_key(model_name: str, generation_config: types.GenerateContentConfigOrDict, prompt: str, cacheable: Optional[bool]):
+    if response_cache.is_cacheable(generation_config, cacheable):
+        return response_cache.get_cache_key(model_name, generation_config, prompt)
+    if response_cache.is_cache_enabled():
+        response_cache.record_skipped()
+    return None
+
+
+def get_request_contents(llm: LlmBackend, model_name: str, prompt: str, generation_config: types.GenerateContentConfigOrDict,
+                         prompt_prefix: Optional[str]) -> Tuple[str, types.GenerateContentConfigOrDict]:
+    """
+        when prompt starts with prompt prefix and prefix is in provider context cache, only suffix is sent with reference to the cache
+    """
+    if prompt_prefix is None or not prompt.startswith(prompt_prefix):
+        return prompt, generation_config
+    cache_name = context_cache.get_cached_content_name(llm, model_name, prompt_prefix)
+    if cache_name is None:
+        return prompt, generation_config
+    tracing.add_span_attributes(context_cache=True)
+    if isinstance(generation_config, types.GenerateContentConfig):
+        return prompt[len(prompt_prefix):], generation_config.model_copy(update={"cached_content": cache_name})
+    return prompt[len(prompt_prefix):], {**generation_config, "cached_content": cache_name}
+
+
+class RequestTimingModel(BaseModel):
+    """
+        provider call is timed from its admission by rate limiter, wait in limiter is reported as queue time.
+        with retries, last admitted attempt is timed
+    """
+    requested_at: float
+    admitted_at: Optional[float] = None
 
-    return llm_client
+    def on_admitted(self):
+        self.admitted_at = time.perf_counter()
 
+    def get_admitted_at(self):
+        return self.admitted_at if self.admitted_at is not None else self.requested_at
 
+    def get_queue_seconds(self):
+        return self.get_admitted_at() - self.requested_at
+
+
+def add_usage_span_attributes(response: Optional[types.GenerateContentResponse]):
+    if response is None or response.usage_metadata is None:
+        return
+    tracing.add_span_attributes(prompt_tokens=response.usage_metadata.prompt_token_count or 0,
+                                cached_tokens=response.usage_metadata.cached_content_token_count or 0,
+                                output_tokens=response.usage_metadata.candidates_token_count or 0)
+
+
+def record_route_usage(model_route: ModelRoute, model_name: str, start_time: float, response: Optional[types.GenerateContentResponse]):
+    usage_metadata = response.usage_metadata if response is not None else None
+    model_routing.record_route_call(model_route, model_name,
+                                    latency_seconds=time.perf_counter() - start_time,
+                                    prompt_tokens=(usage_metadata.prompt_token_count or 0) if usage_metadata is not None else 0,
+                                    output_tokens=(usage_metadata.candidates_token_count or 0) if usage_metadata is not None else 0)
+
+
+@tracing.traced("llm.generate_content")
 def generate_content(prompt: str,
                      generation_config: Optional[types.GenerateContentConfigOrDict] = None,
-                     debug_log: bool = False
+                     debug_log: bool = False,
+                     cacheable: Optional[bool] = None,
+                     prompt_prefix: Optional[str] = None,
+                     model_route: ModelRoute = ModelRoute.Large
                      ):
+    """
+        generates the content for prompt.
+        when response cache is enabled, cacheable configs are served from cache.
+        if cacheable is not provided, it is derived from the generation config.
+        prompt prefix, shared by many prompts, is referenced from provider context cache when backend supports it.
+        model route selects large or small model, by default configured large model is used.
+        slow calls are hedged with duplicate request, when LLM_HEDGE_ENABLED env is true.
+    """
 
     print("-" * 40)
     if debug_log:
@@ -42,26 +152,35 @@ def generate_content(prompt: str,
         print(generation_config)
         print("-" * 40)
 
+    model_route, model_name = model_routing.get_routed_model(get_llm(debug_log), prompt, model_route)
+    if generation_config is None:
+        generation_config = get_generation_config()
+    tracing.add_span_attributes(model=model_name, route=model_route.value, bytes=len(prompt.encode("utf-8")), cache_hit=False)
+
+    cache_key = get_response_cache_key(model_name, generation_config, prompt, cacheable)
+    if cache_key is not None:
+        cached_text = response_cache.get_cached_response(cache_key)
+        if cached_text is not None:
+            print(f"response served from cache [{cache_key[:12]}]")
+            print("-" * 40)
+            tracing.add_span_attributes(cache_hit=True)
+            return cached_text
+
     llm = get_llm(debug_log)
-    model_name = get_env_value("GCP_MODEL_NAME")
     if debug_log:
         print(f"generating contents using model [{model_name}]")
 
-    if generation_config is None:
-        generation_config = types.GenerateContentConfig(
-            safety_settings=[
-                types.SafetySetting(
-                    category=types.HarmCategory.HARM_CATEGORY_HATE_SPEECH,
-                    threshold=types.HarmBlockThreshold.BLOCK_ONLY_HIGH
-                )
-            ]
-        )
-
-    response = llm.models.generate_content(
+    request_contents, request_config = get_request_contents(llm, model_name, prompt, generation_config, prompt_prefix)
+    request_timing = RequestTimingModel(requested_at=time.perf_counter())
+    # only admitted call is hedged, duplicate request also takes rate limiter capacity
+    response = get_rate_limiter().call(lambda: llm.generate_content(
         model=model_name,
-        contents=prompt,
-        config=generation_config,
-    )
+        contents=request_contents,
+        config=request_config,
+    ), estimated_tokens=tokens.estimate_tokens(request_contents), hedger=hedging.get_request_hedger(), on_admitted=request_timing.on_admitted)
+    add_usage_span_attributes(response)
+    tracing.add_span_attributes(queue_seconds=round(request_timing.get_queue_seconds(), 3))
+    record_route_usage(model_route, model_name, request_timing.get_admitted_at(), response)
 
     if debug_log:
         print("response: ", response)
@@ -90,4 +209,68 @@ def generate_content(prompt: str,
     print("response text: ", response.text)
     print("-" * 40)
 
-    return response.text.strip() if response.text is not None else ""
+    response_text = response.text.strip() if response.text is not None else ""
+    if cache_key is not None:
+        response_cache.store_response(cache_key, response_text)
+    return response_text
+
+
+def generate_content_stream(prompt: str,
+                            generation_config: Optional[types.GenerateContentConfigOrDict] = None,
+                            cacheable: Optional[bool] = None,
+                            prompt_prefix: Optional[str] = None,
+                            model_route: ModelRoute = ModelRoute.Large
+                            ) -> Iterator[str]:
+    """
+        yields text fragments as the model generates them.
+        time to first fragment is reported separately from total time.
+        cached response is yielded as single fragment. prompt prefix and model route are used same as generate_content
+    """
+    print("-" * 40)
+    model_route, model_name = model_routing.get_routed_model(get_llm(), prompt, model_route)
+    if generation_config is None:
+        generation_config = get_generation_config()
+
+    cache_key = get_response_cache_key(model_name, generation_config, prompt, cacheable)
+    if cache_key is not None:
+        cached_text = response_cache.get_cached_response(cache_key)
+        if cached_text is not None:
+            print(f"response served from cache [{cache_key[:12]}]")
+            print("-" * 40)
+            yield cached_text
+            return
+
+    llm = get_llm()
+    request_timing = RequestTimingModel(requested_at=time.perf_counter())
+    first_fragment_seconds: Optional[float] = None
+    fragments: List[str] = []
+    with tracing.span("llm.generate_content_stream", model=model_name, route=model_route.value, bytes=len(prompt.encode("utf-8"))) as span_attributes:
+        last_chunk: Optional[types.GenerateContentResponse] = None
+        request_contents, request_config = get_request_contents(llm, model_name, prompt, generation_config, prompt_prefix)
+        for response_chunk in get_rate_limiter().call_stream(lambda: llm.generate_content_stream(
+            model=model_name,
+            contents=request_contents,
+            config=request_config,
+        ), estimated_tokens=tokens.estimate_tokens(request_contents), on_admitted=request_timing.on_admitted):
+            # usage metadata of last chunk is total of the stream
+            last_chunk = response_chunk
+            if not response_chunk.text:
+                continue
+            if first_fragment_seconds is None:
+                first_fragment_seconds = time.perf_counter() - request_timing.get_admitted_at()
+                span_attributes["first_fragment_seconds"] = round(first_fragment_seconds, 3)
+            fragments.append(response_chunk.text)
+            yield response_chunk.text
+        add_usage_span_attributes(last_chunk)
+        span_attributes["queue_seconds"] = round(request_timing.get_queue_seconds(), 3)
+        record_route_usage(model_route, model_name, request_timing.get_admitted_at(), last_chunk)
+
+    total_seconds = time.perf_counter() - request_timing.get_admitted_at()
+    response_text = "".join(fragments).strip()
+    first_fragment_time = f"{first_fragment_seconds:.2f}" if first_fragment_seconds is not None else "NA"
+    print(f"streamed response of {len(fragments)} fragments. time to first fragment: {first_fragment_time} seconds, total time: {total_seconds:.2f} seconds")
+    print("response text: ", response_text)
+    print("-" * 40)
+
+    if cache_key is not None:
+        response_cache.store_response(cache_key, response_text)
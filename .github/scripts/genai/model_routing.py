@@ -0,0 +1,61 @@
+from enum import Enum
+from threading import Lock
+from typing import Dict, List
+from pydantic import BaseModel, Field
+from . import tokens
+from .backends import LlmBackend
+from ..utils import get_env_int_value
+
+
+class ModelRoute(Enum):
+    # configured model of backend
+    Large = "large"
+    # fast and cheap model of backend, when it is configured
+    Small = "small"
+    # small model when estimated prompt tokens are within LLM_SMALL_MODEL_MAX_TOKENS, otherwise large model
+    BySize = "by-size"
+
+
+class RouteStatsModel(BaseModel):
+    model_name: str
+    latencies: List[float] = Field(default_factory=list)
+    prompt_tokens: int = 0
+    output_tokens: int = 0
+
+
+route_stats: Dict[str, RouteStatsModel] = {}
+route_stats_lock = Lock()
+
+
+def get_routed_model(llm: LlmBackend, prompt: str, model_route: ModelRoute):
+    """
+        returns resolved route and its model name. small route falls back to large model, when backend has no small model
+    """
+    small_model_name = llm.get_small_model_name()
+    if model_route == ModelRoute.BySize:
+        max_tokens = get_env_int_value("LLM_SMALL_MODEL_MAX_TOKENS", default_value=4000, min_value=0)
+        model_route = ModelRoute.Small if tokens.estimate_tokens(prompt) <= max_tokens else ModelRoute.Large
+    if model_route == ModelRoute.Small and small_model_name is not None:
+        return ModelRoute.Small, small_model_name
+    return ModelRoute.Large, llm.get_model_name()
+
+
+def record_route_call(model_route: ModelRoute, model_name: str, latency_seconds: float, prompt_tokens: int, output_tokens: int):
+    with route_stats_lock:
+        stats = route_stats.setdefault(model_route.value, RouteStatsModel(model_name=model_name))
+        stats.latencies.append(latency_seconds)
+        stats.prompt_tokens += prompt_tokens
+        stats.output_tokens += output_tokens
+
+
+def get_percentile(values: List[float], percentile: float):
+    sorted_values = sorted(values)
+    return sorted_values[min(len(sorted_values) - 1, int(percentile * len(sorted_values)))]
+
+
+def print_route_stats():
+    with route_stats_lock:
+        for route_value, stats in sorted(route_stats.items()):
+            print(f"model route [{route_value}] model={stats.model_name}: calls={len(stats.latencies)}, "
+                  f"p50 latency={get_percentile(stats.latencies, 0.5):.2f}s, p90 latency={get_percentile(stats.latencies, 0.9):.2f}s, "
+                  f"prompt tokens={stats.prompt_tokens}, output tokens={stats.output_tokens}")
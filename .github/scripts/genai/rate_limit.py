@@ -0,0 +1,287 @@
+import asyncio
+import random
+from threading import BoundedSemaphore, Lock
+import time
+from typing import Awaitable, Callable, Iterator, Optional, TypeVar
+import httpx
+from google.genai import errors
+from pydantic import BaseModel
+from .hedging import RequestHedger
+from ..utils import get_env_float_value, get_env_int_value, tracing
+
+
+RETRYABLE_STATUS_CODES = {429, 500, 502, 503, 504}
+RETRYABLE_STATUSES = {"RESOURCE_EXHAUSTED", "UNAVAILABLE", "INTERNAL", "DEADLINE_EXCEEDED"}
+MIN_THROUGHPUT_FACTOR = 0.1
+
+# Result Type
+RT = TypeVar("RT")
+
+
+class TokenBucket:
+    """
+        thread safe token bucket refilled continuously at rate per minute.
+        capacity is one minute worth of tokens
+    """
+
+    def __init__(self, rate_per_minute: float):
+        self.rate_per_minute = rate_per_minute
+        self.capacity = rate_per_minute
+        self.available = rate_per_minute
+        self.updated_at = time.monotonic()
+        self.lock = Lock()
+
+    def refill(self):
+        now = time.monotonic()
+        self.available = min(self.capacity, self.available + (now - self.updated_at) * self.rate_per_minute / 60)
+        self.updated_at = now
+
+    def set_rate(self, rate_per_minute: float):
+        with self.lock:
+            self.refill()
+            self.rate_per_minute = rate_per_minute
+
+    def try_acquire(self, amount: float):
+        """
+            acquires the amount if available and returns 0. otherwise returns the seconds to wait
+        """
+        with self.lock:
+            self.refill()
+            amount = min(amount, self.capacity)
+            if self.available >= amount:
+                self.available -= amount
+                return 0.0
+            return (amount - self.available) * 60 / self.rate_per_minute
+
+    def release(self, amount: float = 1):
+        """
+            gives back the amount acquired for a call, which was not sent
+        """
+        with self.lock:
+            self.refill()
+            self.available = min(self.capacity, self.available + min(amount, self.capacity))
+
+    def acquire(self, amount: float = 1):
+        wait_seconds = self.try_acquire(amount)
+        while wait_seconds > 0:
+            time.sleep(wait_seconds)
+            wait_seconds = self.try_acquire(amount)
+
+    async def acquire_async(self, amount: float = 1):
+        wait_seconds = self.try_acquire(amount)
+        while wait_seconds > 0:
+            await asyncio.sleep(wait_seconds)
+            wait_seconds = self.try_acquire(amount)
+
+
+class RateLimitStatsModel(BaseModel):
+    calls: int = 0
+    retries: int = 0
+    quota_errors: int = 0
+    failures: int = 0
+
+
+def is_quota_error(error: BaseException):
+    return isinstance(error, errors.APIError) and (error.code == 429 or error.status == "RESOURCE_EXHAUSTED")
+
+
+def is_retryable_error(error: BaseException):
+    if isinstance(error, errors.APIError):
+        return error.code in RETRYABLE_STATUS_CODES or error.status in RETRYABLE_STATUSES
+    return isinstance(error, httpx.TransportError)
+
+
+class LlmRateLimiter:
+    """
+        guards llm calls with requests/min and tokens/min buckets, a concurrency semaphore
+        and retries with decorrelated jitter for retryable errors only.
+        throughput is halved on quota errors and recovers additively on success.
+    """
+
+    def __init__(self, requests_per_minute: int, tokens_per_minute: int, max_concurrency: int,
+                 max_retries: int, retry_base_seconds: float, retry_max_seconds: float):
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self.request_bucket = TokenBucket(requests_per_minute) if requests_per_minute > 0 else None
+        self.token_bucket = TokenBucket(tokens_per_minute) if tokens_per_minute > 0 else None
+        self.semaphore = BoundedSemaphore(max_concurrency)
+        self.max_retries = max_retries
+        self.retry_base_seconds = retry_base_seconds
+        self.retry_max_seconds = retry_max_seconds
+        self.throughput_factor = 1.0
+        self.stats = RateLimitStatsModel()
+        self.lock = Lock()
+
+    def update_throughput(self, error: Optional[BaseException]):
+        with self.lock:
+            previous_factor = self.throughput_factor
+            if error is None:
+                self.throughput_factor = min(1.0, self.throughput_factor + 0.05)
+            elif is_quota_error(error):
+                self.stats.quota_errors += 1
+                self.throughput_factor = max(MIN_THROUGHPUT_FACTOR, self.throughput_factor / 2)
+                print(f"llm quota error, reducing throughput to {self.throughput_factor:.0%}")
+            if previous_factor == self.throughput_factor:
+                return
+            if self.request_bucket is not None:
+                self.request_bucket.set_rate(self.requests_per_minute * self.throughput_factor)
+            if self.token_bucket is not None:
+                self.token_bucket.set_rate(self.tokens_per_minute * self.throughput_factor)
+
+    def get_retry_delay(self, error: BaseException, attempt: int, previous_delay: float):
+        """
+            returns seconds to wait before next attempt, or None if the error should not be retried
+        """
+        if attempt >= self.max_retries or not is_retryable_error(error):
+            with self.lock:
+                self.stats.failures += 1
+            return None
+        with self.lock:
+            self.stats.retries += 1
+        tracing.increment_span_attribute("retries")
+        # decorrelated jitter
+        delay = min(self.retry_max_seconds, random.uniform(self.retry_base_seconds, previous_delay * 3))
+        print(f"retryable llm error [{error}]. retrying attempt {attempt + 1} of {self.max_retries} after {delay:.2f} seconds")
+        return delay
+
+    def try_admit(self, estimated_tokens: int = 0):
+        """
+            admits a call only when buckets and semaphore allow it without waiting. admitted call must call release_admission
+        """
+        if not self.semaphore.acquire(blocking=False):
+            return False
+        if self.request_bucket is not None and self.request_bucket.try_acquire(1) > 0:
+            self.semaphore.release()
+            return False
+        if self.token_bucket is not None and self.token_bucket.try_acquire(estimated_tokens) > 0:
+            if self.request_bucket is not None:
+                self.request_bucket.release(1)
+            self.semaphore.release()
+            return False
+        return True
+
+    def release_admission(self):
+        self.semaphore.release()
+
+    def call(self, llm_call: Callable[[], RT], estimated_tokens: int = 0, hedger: Optional[RequestHedger] = None,
+             on_admitted: Optional[Callable[[], None]] = None) -> RT:
+        """
+            on_admitted is called when an attempt passes the buckets and semaphore, so callers can time the provider call without queue time.
+            when hedger is provided, only the admitted call is hedged, and duplicate request is sent only if it is admitted without waiting
+        """
+        with self.lock:
+            self.stats.calls += 1
+        attempt = 0
+        delay = self.retry_base_seconds
+        while True:
+            if self.request_bucket is not None:
+                self.request_bucket.acquire()
+            if self.token_bucket is not None:
+                self.token_bucket.acquire(estimated_tokens)
+            try:
+                with self.semaphore:
+                    if on_admitted is not None:
+                        on_admitted()
+                    if hedger is not None:
+                        result = hedger.call(llm_call, estimated_tokens,
+                                             try_admit_hedge=lambda: self.try_admit(estimated_tokens),
+                                             release_hedge=self.release_admission)
+                    else:
+                        result = llm_call()
+                self.update_throughput(None)
+                return result
+            except Exception as e:
+                self.update_throughput(e)
+                retry_delay = self.get_retry_delay(e, attempt, delay)
+                if retry_delay is None:
+                    raise
+                attempt += 1
+                delay = retry_delay
+                time.sleep(delay)
+
+    def call_stream(self, llm_stream_call: Callable[[], Iterator[RT]], estimated_tokens: int = 0,
+                    on_admitted: Optional[Callable[[], None]] = None) -> Iterator[RT]:
+        """
+            the semaphore is held until the stream is consumed.
+            errors are retried only until first item is received. on_admitted is called same as call
+        """
+        with self.lock:
+            self.stats.calls += 1
+        attempt = 0
+        delay = self.retry_base_seconds
+        while True:
+            if self.request_bucket is not None:
+                self.request_bucket.acquire()
+            if self.token_bucket is not None:
+                self.token_bucket.acquire(estimated_tokens)
+            has_received = False
+            try:
+                with self.semaphore:
+                    if on_admitted is not None:
+                        on_admitted()
+                    for stream_item in llm_stream_call():
+                        has_received = True
+                        yield stream_item
+                self.update_throughput(None)
+                return
+            except Exception as e:
+                self.update_throughput(e)
+                retry_delay = None if has_received else self.get_retry_delay(e, attempt, delay)
+                if retry_delay is None:
+                    raise
+                attempt += 1
+                delay = retry_delay
+            time.sleep(delay)
+
+    async def call_async(self, llm_call: Callable[[], Awaitable[RT]], estimated_tokens: int = 0) -> RT:
+        with self.lock:
+            self.stats.calls += 1
+        attempt = 0
+        delay = self.retry_base_seconds
+        while True:
+            if self.request_bucket is not None:
+                await self.request_bucket.acquire_async()
+            if self.token_bucket is not None:
+                await self.token_bucket.acquire_async(estimated_tokens)
+            await asyncio.to_thread(self.semaphore.acquire)
+            try:
+                result = await llm_call()
+                self.update_throughput(None)
+                return result
+            except Exception as e:
+                self.update_throughput(e)
+                retry_delay = self.get_retry_delay(e, attempt, delay)
+                if retry_delay is None:
+                    raise
+                attempt += 1
+                delay = retry_delay
+            finally:
+                self.semaphore.release()
+            await asyncio.sleep(delay)
+
+    def print_stats(self):
+        with self.lock:
+            print(f"llm rate limiter: calls={self.stats.calls}, retries={self.stats.retries}, quota errors={self.stats.quota_errors}, "
+                  f"failures={self.stats.failures}, current throughput={self.throughput_factor:.0%}")
+
+
+rate_limiter: Optional[LlmRateLimiter] = None
+rate_limiter_lock = Lock()
+
+
+def get_rate_limiter(default_requests_per_minute: int = 60):
+    """
+        requests per minute default is of llm backend, LLM_REQUESTS_PER_MINUTE=0 disables request rate limit.
+        LLM_MAX_CONCURRENCY caps in flight llm calls of the whole process, including hedged requests and all milestones of a run.
+        RELEASE_LLM_CONCURRENCY only sizes llm worker pool of each release change, so when both are set, the lower one wins
+    """
+    global rate_limiter
+    with rate_limiter_lock:
+        if rate_limiter is None:
+            rate_limiter = LlmRateLimiter(requests_per_minute=get_env_int_value("LLM_REQUESTS_PER_MINUTE", default_value=default_requests_per_minute, min_value=0),
+                                          tokens_per_minute=get_env_int_value("LLM_TOKENS_PER_MINUTE", default_value=0, min_value=0),
+                                          max_concurrency=get_env_int_value("LLM_MAX_CONCURRENCY", default_value=4),
+                                          max_retries=get_env_int_value("LLM_MAX_RETRIES", default_value=5, min_value=0),
+                                          retry_base_seconds=get_env_float_value("LLM_RETRY_BASE_SECONDS", default_value=1, min_value=0.01),
+                                          retry_max_seconds=get_env_float_value("LLM_RETRY_MAX_SECONDS", default_value=60, min_value=0.01))
+    return rate_limiter
@@ -0,0 +1,147 @@
+import hashlib
+import json
+import os
+from pathlib import Path
+from threading import Lock
+import time
+from typing import Any, Optional
+from pydantic import BaseModel
+from ..utils import get_env_bool_value, get_env_int_value, get_optional_env_value, rootpath, write_atomic
+
+
+class CacheStatsModel(BaseModel):
+    hits: int = 0
+    misses: int = 0
+    expired: int = 0
+    stores: int = 0
+    evictions: int = 0
+    skipped: int = 0
+
+
+cache_stats = CacheStatsModel()
+cache_lock = Lock()
+
+
+def is_cache_enabled():
+    return get_env_bool_value("LLM_CACHE_ENABLED")
+
+
+def get_cache_dir():
+    cache_dir = Path(get_optional_env_value("LLM_CACHE_DIR", str(rootpath/"dist/llm-cache")))
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    return cache_dir
+
+
+def get_config_dict(generation_config: Any):
+    if generation_config is None:
+        return {}
+    if isinstance(generation_config, BaseModel):
+        return generation_config.model_dump(mode="json", exclude_none=True)
+    return generation_config
+
+
+def is_deterministic_config(generation_config: Any):
+    """
+        greedy decoding configs produce same response for same prompt
+    """
+    config_dict = get_config_dict(generation_config)
+    return config_dict.get("temperature") == 0 or config_dict.get("top_k") == 1
+
+
+def is_cacheable(generation_config: Any, cacheable: Optional[bool] = None):
+    """
+        deterministic configs are cacheable by default.
+        others need explicit opt-in, either by call argument or by LLM_CACHE_NONDETERMINISTIC env
+    """
+    if not is_cache_enabled():
+        return False
+    if cacheable is not None:
+        return cacheable
+    return is_deterministic_config(generation_config) or get_env_bool_value("LLM_CACHE_NONDETERMINISTIC")
+
+
+def get_cache_key(model_name: str, generation_config: Any, prompt: str):
+    key_dict = {
+        "model": model_name,
+        "config": get_config_dict(generation_config),
+        "prompt": prompt
+    }
+    key_json = json.dumps(key_dict, sort_keys=True, default=str)
+    return hashlib.sha256(key_json.encode("utf-8")).hexdigest()
+
+
+def get_cached_response(cache_key: str) -> Optional[str]:
+    cache_path = get_cache_dir()/f"{cache_key}.json"
+    ttl_seconds = get_env_int_value("LLM_CACHE_TTL_SECONDS", default_value=7*24*60*60)
+    try:
+        with open(cache_path, mode="r", encoding="utf-8") as f:
+            cached_entry = json.load(f)
+        if cached_entry["created_at"] + ttl_seconds < time.time():
+            cache_path.unlink(missing_ok=True)
+            with cache_lock:
+                cache_stats.expired += 1
+                cache_stats.misses += 1
+            return None
+        # access time is tracked by modified time for lru eviction
+        os.utime(cache_path)
+    except (OSError, ValueError, KeyError):
+        with cache_lock:
+            cache_stats.misses += 1
+        return None
+
+    with cache_lock:
+        cache_stats.hits += 1
+    return cached_entry["text"]
+
+
+def store_response(cache_key: str, text: str):
+    """
+        cache write failure is logged and not raised, the response is already paid for
+    """
+    cache_dir = get_cache_dir()
+    cache_path = cache_dir/f"{cache_key}.json"
+    try:
+        write_atomic(cache_path, json.dumps({"created_at": time.time(), "text": text}))
+    except OSError as e:
+        print(f"llm response cache write of [{cache_key[:12]}] failed. error: {e}")
+        return
+
+    with cache_lock:
+        cache_stats.stores += 1
+        evict_least_recently_used(cache_dir)
+
+
+def evict_least_recently_used(cache_dir: Path):
+    max_bytes = get_env_int_value("LLM_CACHE_MAX_BYTES", default_value=50*1024*1024)
+    cache_files = []
+    total_bytes = 0
+    for cache_path in cache_dir.glob("*.json"):
+        try:
+            file_stat = cache_path.stat()
+        except OSError:
+            continue
+        cache_files.append((file_stat.st_mtime, file_stat.st_size, cache_path))
+        total_bytes += file_stat.st_size
+
+    cache_files.sort()
+    for _, file_size, cache_path in cache_files:
+        if total_bytes <= max_bytes:
+            break
+        cache_path.unlink(missing_ok=True)
+        total_bytes -= file_size
+        cache_stats.evictions += 1
+
+
+def record_skipped():
+    with cache_lock:
+        cache_stats.skipped += 1
+
+
+def print_cache_stats():
+    if not is_cache_enabled():
+        return
+    with cache_lock:
+        total_lookups = cache_stats.hits + cache_stats.misses
+        hit_ratio = cache_stats.hits / total_lookups if total_lookups > 0 else 0
+        print(f"llm response cache: hits={cache_stats.hits}, misses={cache_stats.misses}, hit ratio={hit_ratio:.0%}, "
+              f"expired={cache_stats.expired}, stores={cache_stats.stores}, evictions={cache_stats.evictions}, not cacheable={cache_stats.skipped}")
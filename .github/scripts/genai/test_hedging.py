@@ -0,0 +1,91 @@
+from threading import Lock, Thread
+import time
+import unittest
+from typing import List, Tuple, Union
+from .hedging import RequestHedger
+from .rate_limit import LlmRateLimiter
+
+
+class SlowFakeProvider:
+    """
+        each invocation sleeps and then returns or raises, as given by behaviors in invocation order
+    """
+
+    def __init__(self, behaviors: List[Tuple[float, Union[str, Exception]]]):
+        self.behaviors = behaviors
+        self.invocations = 0
+        self.lock = Lock()
+
+    def generate(self):
+        with self.lock:
+            sleep_seconds, outcome = self.behaviors[min(self.invocations, len(self.behaviors) - 1)]
+            self.invocations += 1
+        time.sleep(sleep_seconds)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+
+
+def get_rate_limiter(max_concurrency: int):
+    return LlmRateLimiter(requests_per_minute=6000, tokens_per_minute=0, max_concurrency=max_concurrency,
+                          max_retries=0, retry_base_seconds=0.01, retry_max_seconds=0.01)
+
+
+def get_hedger():
+    hedger = RequestHedger(percentile=0.5, max_ratio=1.0, min_samples=1, min_delay_seconds=0.05, max_workers=4)
+    hedger.record_latency(0, 0.05)
+    return hedger
+
+
+class RequestHedgingTest(unittest.TestCase):
+
+    def assert_limiter_released(self, rate_limiter: LlmRateLimiter, hedger: RequestHedger, max_concurrency: int):
+        hedger.executor.shutdown(wait=True)
+        self.assertTrue(all(rate_limiter.try_admit() for _ in range(max_concurrency)))
+
+    def test_hedge_wins_over_slow_primary(self):
+        rate_limiter, hedger = get_rate_limiter(2), get_hedger()
+        provider = SlowFakeProvider([(0.5, "primary"), (0.01, "hedge")])
+        self.assertEqual(rate_limiter.call(provider.generate, estimated_tokens=10, hedger=hedger), "hedge")
+        self.assertEqual((hedger.stats.hedged, hedger.stats.hedge_wins), (1, 1))
+        self.assert_limiter_released(rate_limiter, hedger, 2)
+
+    def test_hedge_is_used_when_primary_fails(self):
+        rate_limiter, hedger = get_rate_limiter(2), get_hedger()
+        provider = SlowFakeProvider([(0.15, ValueError("primary failed")), (0.3, "hedge")])
+        self.assertEqual(rate_limiter.call(provider.generate, estimated_tokens=10, hedger=hedger), "hedge")
+        self.assert_limiter_released(rate_limiter, hedger, 2)
+
+    def test_primary_is_used_when_hedge_fails(self):
+        rate_limiter, hedger = get_rate_limiter(2), get_hedger()
+        provider = SlowFakeProvider([(0.3, "primary"), (0.01, ValueError("hedge failed"))])
+        self.assertEqual(rate_limiter.call(provider.generate, estimated_tokens=10, hedger=hedger), "primary")
+        self.assertEqual(hedger.stats.hedge_wins, 0)
+        self.assert_limiter_released(rate_limiter, hedger, 2)
+
+    def test_no_hedge_without_spare_limiter_capacity(self):
+        rate_limiter, hedger = get_rate_limiter(1), get_hedger()
+        provider = SlowFakeProvider([(0.3, "primary"), (0.01, "hedge")])
+        self.assertEqual(rate_limiter.call(provider.generate, estimated_tokens=10, hedger=hedger), "primary")
+        self.assertEqual((hedger.stats.hedged, provider.invocations), (0, 1))
+        self.assert_limiter_released(rate_limiter, hedger, 1)
+
+    def test_wait_in_limiter_does_not_trigger_hedge(self):
+        rate_limiter, hedger = get_rate_limiter(1), get_hedger()
+        blocking_call = Thread(target=rate_limiter.call, args=(lambda: time.sleep(0.4),))
+        blocking_call.start()
+        time.sleep(0.05)
+        provider = SlowFakeProvider([(0.01, "primary"), (0.01, "hedge")])
+        admitted_times: List[float] = []
+        start_time = time.perf_counter()
+        result = rate_limiter.call(provider.generate, estimated_tokens=10, hedger=hedger,
+                                   on_admitted=lambda: admitted_times.append(time.perf_counter()))
+        blocking_call.join()
+        self.assertEqual((result, hedger.stats.hedged, provider.invocations), ("primary", 0, 1))
+        # queue time is before admission
+        self.assertGreater(admitted_times[0] - start_time, 0.2)
+        self.assert_limiter_released(rate_limiter, hedger, 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,59 @@
+import math
+from threading import Lock
+from . import llm
+
+
+# rough ratio for english text and json. it is tuned by calibration with model's token count
+DEFAULT_CHARS_PER_TOKEN = 4.0
+TRUNCATION_MARKER = " ...[truncated]"
+
+chars_per_token = DEFAULT_CHARS_PER_TOKEN
+calibration_lock = Lock()
+is_calibrated = False
+
+
+def estimate_tokens(text: str):
+    """
+        fast local estimate of token count of the text
+    """
+    if len(text) == 0:
+        return 0
+    return math.ceil(len(text) / chars_per_token)
+
+
+def calibrate_token_estimator(sample_text: str):
+    """
+        calibrates the chars per token ratio once per process using model's token counting.
+        the estimator keeps default ratio, if token count is not available
+    """
+    global chars_per_token, is_calibrated
+    with calibration_lock:
+        if is_calibrated or len(sample_text) == 0:
+            return chars_per_token
+        is_calibrated = True
+        try:
+            token_count = llm.count_tokens(sample_text)
+            if token_count > 0:
+                chars_per_token = len(sample_text) / token_count
+                print(f"calibrated token estimator to [{chars_per_token:.2f}] chars per token using sample of {len(sample_text)} chars")
+        except Exception as e:
+            print("unable to calibrate token estimator, using default ratio. error: ", e)
+
+    return chars_per_token
+
+
+def truncate_to_tokens(text: str, max_tokens: int):
+    """
+        deterministic truncation of text to the token limit.
+        the char limit is derived from the default ratio, so the result does not depend on calibration.
+        cuts at last whitespace when possible and appends truncation marker
+    """
+    max_chars = int(max_tokens * DEFAULT_CHARS_PER_TOKEN)
+    if len(text) <= max_chars:
+        return text
+
+    cut_index = max_chars - len(TRUNCATION_MARKER)
+    whitespace_index = text.rfind(" ", 0, cut_index)
+    if whitespace_index > cut_index * 0.8:
+        cut_index = whitespace_index
+    return text[:max(cut_index, 0)].rstrip() + TRUNCATION_MARKER
@@ -1,3 +1,8 @@
-from .models import ReleaseTemplateModel, CategoryModel, LabelsModel, IssueModel
-from .issues import get_issues
-from .summarize_issues import summarize_category
+from .models import ReleaseTemplateModel, CategoryModel, LabelsModel, IssueModel, MilestoneModel
+from .issues import get_issues, get_milestone_issues
+from .category_assignment import assign_issues_to_categories
+from .github_client import get_github_client
+from .summarize_issues import calibrate_issue_token_estimator, summarize_category
+from .batch_summarize import get_batch_category_summaries, prepare_category_batch
+from .category_manifest import CategoryManifest, create_category_manifest, get_category_fingerprint, get_summarizer_hash
+from .checkpoint import RunCheckpoint, create_run_checkpoint
@@ -0,0 +1,75 @@
+from pathlib import Path
+from typing import Dict, List
+from pydantic import BaseModel
+from .models import IssueModel, ReleaseTemplateModel
+from .summarize_issues import calibrate_issue_token_estimator, dedupe_bullets, get_category_prompts, get_summarizer_generation_config
+from ..genai import batch
+from ..utils import get_optional_env_value, rootpath, write_atomic
+
+
+class BatchUnitModel(BaseModel):
+    unit_id: str
+    category_title: str
+    chunk_index: int
+
+
+class BatchStateModel(BaseModel):
+    milestone_title: str
+    category_titles: List[str]
+    units: List[BatchUnitModel]
+
+
+def get_batch_dir():
+    return Path(get_optional_env_value("RELEASE_BATCH_DIR", str(rootpath/"dist/batch")))
+
+
+def prepare_category_batch(template_model: ReleaseTemplateModel, milestone_title: str, category_issues: List[List[IssueModel]]):
+    """
+        phase one of batch mode. writes every category chunk prompt as batch prediction request,
+        and state file mapping unit ids to category chunks
+    """
+    calibrate_issue_token_estimator(category_issues)
+    batch_dir = get_batch_dir()
+    units: List[BatchUnitModel] = []
+    batch_requests: List[batch.BatchRequestModel] = []
+    for category, issues in zip(template_model.categories, category_issues):
+        prompts = get_category_prompts(category_title=category.safe_title,
+                                       category_labels=category.labels.include if category.labels.include is not None else [],
+                                       change_template=template_model.category_item_change_template,
+                                       issues=issues)
+        for chunk_index, prompt in enumerate(prompts):
+            unit_id = f"u{len(units):05d}"
+            units.append(BatchUnitModel(unit_id=unit_id, category_title=category.safe_title, chunk_index=chunk_index))
+            batch_requests.append(batch.BatchRequestModel(unit_id=unit_id, prompt=prompt))
+
+    batch.write_batch_requests(batch_dir/"requests.jsonl", batch_requests, get_summarizer_generation_config())
+    batch_state = BatchStateModel(milestone_title=milestone_title,
+                                  category_titles=[category.safe_title for category in template_model.categories],
+                                  units=units)
+    state_path = batch_dir/"state.json"
+    write_atomic(state_path, batch_state.model_dump_json(indent=2))
+    print(f"batch state of {len(units)} units is written to {state_path}")
+
+
+def get_batch_category_summaries(response_path: Path, milestone_title: str) -> Dict[str, str]:
+    """
+        phase two of batch mode. returns summary by category title.
+        chunk summaries of a category are joined in chunk order and deduped, there is no reduce call in batch mode.
+        category with missing unit responses is left out, so it is summarized live
+    """
+    batch_state = BatchStateModel.model_validate_json((get_batch_dir()/"state.json").read_text(encoding="utf-8"))
+    if batch_state.milestone_title != milestone_title:
+        raise ValueError(f"batch state is prepared for milestone [{batch_state.milestone_title}], not for [{milestone_title}]")
+    response_texts = batch.read_batch_responses(response_path)
+    category_chunks: Dict[str, List[str]] = {category_title: [] for category_title in batch_state.category_titles}
+    incomplete_categories = set()
+    for unit in sorted(batch_state.units, key=lambda unit: (unit.category_title, unit.chunk_index)):
+        if unit.unit_id not in response_texts:
+            incomplete_categories.add(unit.category_title)
+            continue
+        category_chunks[unit.category_title].append(response_texts[unit.unit_id])
+
+    if len(incomplete_categories) > 0:
+        print(f"batch responses are missing for categories {sorted(incomplete_categories)}, these will be summarized live")
+    return {category_title: dedupe_bullets("\n".join(chunks))
+            for category_title, chunks in category_chunks.items() if category_title not in incomplete_categories}
@@ -0,0 +1,81 @@
+from enum import Enum
+from typing import Iterable, List, Optional, Set
+from .models import CategoryModel, IssueModel, ReleaseTemplateModel
+from ..utils import get_converted_enum, get_optional_env_value, tracing
+
+
+class DuplicateIssueMode(Enum):
+    # issue is summarized only in first matching category of template
+    Primary = "primary"
+    # issue is summarized in first matching category, other matching categories get title only reference
+    CrossReference = "cross-reference"
+
+
+def get_duplicate_issue_mode():
+    mode_value = get_optional_env_value("RELEASE_DUPLICATE_ISSUE_MODE", DuplicateIssueMode.Primary.value)
+    duplicate_issue_mode = get_converted_enum(DuplicateIssueMode, mode_value)
+    if duplicate_issue_mode is None:
+        raise ValueError(f"RELEASE_DUPLICATE_ISSUE_MODE env [{mode_value}] is not supported")
+    return duplicate_issue_mode
+
+
+def get_casefolded_labels(labels: Optional[Iterable[str]]) -> Set[str]:
+    """
+        github label search is case insensitive, so labels are compared casefolded
+    """
+    return {label.casefold() for label in labels} if labels is not None else set()
+
+
+def is_category_issue(category: CategoryModel, issue: IssueModel):
+    """
+        same as label search of category, issue has any of include labels and none of exclude labels
+    """
+    include_labels = get_casefolded_labels(category.labels.include)
+    exclude_labels = get_casefolded_labels(category.labels.exclude)
+    issue_labels = get_casefolded_labels(issue.labels)
+    return len(issue_labels & (include_labels - exclude_labels)) > 0 and len(issue_labels & exclude_labels) == 0
+
+
+def get_cross_reference_issue(issue: IssueModel, primary_category: CategoryModel):
+    return issue.model_copy(update={
+        "body": "",
+        "comments": issue.comments.model_copy(update={"top_prioritized": []}),
+        "commits": [],
+        "primary_category": primary_category.safe_title
+    })
+
+
+@tracing.traced("assign_issues_to_categories")
+def assign_issues_to_categories(template_model: ReleaseTemplateModel, issues: List[IssueModel]):
+    """
+        computes categories of each issue once. returns issues of each category in template order.
+        an issue matching multiple categories is sent to llm with full details only once
+    """
+    duplicate_issue_mode = get_duplicate_issue_mode()
+    generic_exclude_labels = get_casefolded_labels(template_model.category_labels.exclude) if template_model.category_labels is not None else set()
+    category_issues: List[List[IssueModel]] = [[] for _ in template_model.categories]
+    duplicate_count = 0
+    uncategorized_issues: List[IssueModel] = []
+    for issue in issues:
+        if len(generic_exclude_labels & get_casefolded_labels(issue.labels)) > 0:
+            continue
+        matched_indices = [ind for ind, category in enumerate(template_model.categories) if is_category_issue(category, issue)]
+        if len(matched_indices) == 0:
+            uncategorized_issues.append(issue)
+            continue
+        primary_index, *other_indices = matched_indices
+        category_issues[primary_index].append(issue)
+        duplicate_count += len(other_indices)
+        if duplicate_issue_mode == DuplicateIssueMode.CrossReference:
+            cross_reference_issue = get_cross_reference_issue(issue, template_model.categories[primary_index])
+            for other_index in other_indices:
+                category_issues[other_index].append(cross_reference_issue)
+
+    for category, assigned_issues in zip(template_model.categories, category_issues):
+        print(f"category [{category.safe_title}] is assigned {len(assigned_issues)} issues")
+    print(f"{duplicate_count} duplicate category matches are resolved in [{duplicate_issue_mode.value}] mode")
+    if len(uncategorized_issues) > 0:
+        print(f"warning: {len(uncategorized_issues)} issues match no category and are left out of release change. "
+              f"issues: {[(issue.number, issue.labels) for issue in uncategorized_issues]}")
+    tracing.add_span_attributes(issues=len(issues), duplicates=duplicate_count, uncategorized=len(uncategorized_issues))
+    return category_issues
@@ -0,0 +1,123 @@
+import hashlib
+import json
+import os
+from pathlib import Path
+from threading import Lock
+from typing import Dict, List, Optional
+from pydantic import BaseModel, Field
+from .models import IssueModel
+from .summarize_issues import get_summarize_mode
+from ..genai import llm, tokens
+from ..utils import get_env_bool_value, get_optional_env_value, get_safe_name, rootpath, write_atomic
+
+
+# bump when summarization changes in a way not covered by prompt files and settings
+SUMMARIZER_VERSION = "1"
+SUMMARIZER_SETTING_ENVS = ("RELEASE_CHUNK_TOKEN_BUDGET", "RELEASE_REDUCE_FANIN", "RELEASE_ISSUE_BODY_MAX_TOKENS",
+                           "RELEASE_ISSUE_COMMENT_MAX_TOKENS", "RELEASE_ISSUE_COMMIT_MAX_TOKENS", "RELEASE_CLUSTER_ISSUES",
+                           "RELEASE_CLUSTER_SIMILARITY", "RELEASE_CLUSTER_FEATURE_BITS",
+                           "RELEASE_ISSUE_CONTEXT_BYTES", "GITHUB_ISSUE_COMMENT_CANDIDATES", "GCP_SMALL_MODEL_NAME", "LLM_SMALL_MODEL_MAX_TOKENS",
+                           "RELEASE_REDUCE_OUTPUT_TOKEN_BUDGET", "LLM_TOKEN_CALIBRATION")
+PROMPT_FILE_NAMES = ("issue-category-summarize-prefix.prompt.txt", "issue-category-summarize.prompt.txt", "issue-category-reduce.prompt.txt")
+
+
+class CategoryManifestEntryModel(BaseModel):
+    fingerprint: str
+    issue_numbers: List[int]
+    summary: str
+
+
+class CategoryManifestModel(BaseModel):
+    categories: Dict[str, CategoryManifestEntryModel] = Field(default_factory=dict)
+
+
+class CategoryManifest:
+    """
+        persists generated summary of each category with fingerprint of its inputs.
+        on rerun, categories with unchanged fingerprint reuse the stored summary instead of llm calls
+    """
+
+    def __init__(self, manifest_path: Path, reuse_stored: bool):
+        self.manifest_path = manifest_path
+        self.stored = self.load() if reuse_stored else CategoryManifestModel()
+        self.current = CategoryManifestModel()
+        self.reused_categories: List[str] = []
+        self.lock = Lock()
+
+    def load(self):
+        try:
+            return CategoryManifestModel.model_validate_json(self.manifest_path.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return CategoryManifestModel()
+
+    def get_summary(self, category_title: str, fingerprint: str) -> Optional[str]:
+        stored_entry = self.stored.categories.get(category_title)
+        if stored_entry is None or stored_entry.fingerprint != fingerprint:
+            return None
+        with self.lock:
+            self.current.categories[category_title] = stored_entry
+            self.reused_categories.append(category_title)
+        print(f"category [{category_title}] is unchanged since last draft, reusing stored summary")
+        return stored_entry.summary
+
+    def set_summary(self, category_title: str, fingerprint: str, issues: List[IssueModel], summary: str):
+        with self.lock:
+            self.current.categories[category_title] = CategoryManifestEntryModel(fingerprint=fingerprint,
+                                                                                 issue_numbers=sorted(issue.number for issue in issues),
+                                                                                 summary=summary)
+
+    def save(self):
+        """
+            only categories of current run are kept, so removed categories are dropped from manifest
+        """
+        with self.lock:
+            manifest_text = self.current.model_dump_json(indent=2)
+        write_atomic(self.manifest_path, manifest_text)
+        print(f"category manifest is written to {self.manifest_path}. reused {len(self.reused_categories)} of {len(self.current.categories)} categories")
+
+
+def create_category_manifest(milestone_title: Optional[str] = None):
+    """
+        stored summaries are reused by default. RELEASE_INCREMENTAL=false regenerates all categories and refreshes the manifest.
+        when milestone title is provided, manifest file is specific to the milestone
+    """
+    manifest_path = Path(get_optional_env_value("RELEASE_MANIFEST_PATH", str(rootpath/"dist/release-manifest/manifest.json")))
+    if milestone_title is not None:
+        manifest_path = manifest_path.with_name(f"{manifest_path.stem}-{get_safe_name(milestone_title)}{manifest_path.suffix}")
+    return CategoryManifest(manifest_path, get_env_bool_value("RELEASE_INCREMENTAL", default_value=True))
+
+
+def get_summarizer_dict():
+    """
+        prompts, summarizer settings and model, the summaries depend on apart from issues
+    """
+    prompt_dir = Path(__file__).resolve().parent
+    return {
+        "version": SUMMARIZER_VERSION,
+        "prompts": [(prompt_dir/file_name).read_text(encoding="utf-8") for file_name in PROMPT_FILE_NAMES],
+        "mode": get_summarize_mode().value,
+        "settings": {env_key: os.getenv(env_key) for env_key in SUMMARIZER_SETTING_ENVS},
+        "model": llm.get_model_name()
+    }
+
+
+def get_summarizer_hash():
+    summarizer_json = json.dumps(get_summarizer_dict(), sort_keys=True, default=str)
+    return hashlib.sha256(summarizer_json.encode("utf-8")).hexdigest()
+
+
+def get_category_fingerprint(category_title: str, category_labels: List[str], change_template: str, issues: List[IssueModel]):
+    """
+        hash of everything the category summary depends on, issue numbers with updated time and linked commits,
+        prompts, summarizer settings, model and token estimate ratio, which decides chunk boundaries
+    """
+    fingerprint_dict = {
+        **get_summarizer_dict(),
+        "chars_per_token": tokens.chars_per_token,
+        "category_title": category_title,
+        "category_labels": sorted(category_labels),
+        "change_template": change_template,
+        "issues": sorted([issue.number, issue.updated_at, issue.commits, issue.primary_category] for issue in issues)
+    }
+    fingerprint_json = json.dumps(fingerprint_dict, sort_keys=True, default=str)
+    return hashlib.sha256(fingerprint_json.encode("utf-8")).hexdigest()
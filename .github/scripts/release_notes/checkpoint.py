@@ -0,0 +1,177 @@
+import hashlib
+import json
+from pathlib import Path
+from threading import Lock
+from typing import Dict, List, Optional, Tuple
+from pydantic import BaseModel, Field
+from .models import IssueModel, MilestoneModel
+from ..utils import get_env_bool_value, get_env_value, get_optional_env_value, get_safe_name, rootpath, write_atomic
+
+
+# bump when checkpoint layout changes, older checkpoints are not resumed
+CHECKPOINT_VERSION = "1"
+CHECKPOINT_FILE_NAME = "checkpoint.json"
+ISSUES_FILE_NAME = "issues.json"
+
+
+class CheckpointCategoryModel(BaseModel):
+    fingerprint: str = ""
+    summary: Optional[str] = None
+    # response text of chunk and reduce prompts by sha256 of prompt
+    responses: Dict[str, str] = Field(default_factory=dict)
+
+
+class CheckpointModel(BaseModel):
+    version: str = CHECKPOINT_VERSION
+    milestone_title: str
+    template_hash: str
+    summarizer_hash: str
+    # sha256 of issues file, empty until issues are fetched
+    issues_hash: str = ""
+    categories: Dict[str, CheckpointCategoryModel] = Field(default_factory=dict)
+
+
+class CheckpointIssuesModel(BaseModel):
+    milestone: MilestoneModel
+    category_issues: List[List[IssueModel]]
+
+
+class CheckpointStatsModel(BaseModel):
+    resumed_issues: bool = False
+    resumed_summaries: int = 0
+    resumed_responses: int = 0
+
+
+def get_text_hash(text: str):
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class RunCheckpoint:
+    """
+        records completed stages of a release change run, fetched category issues, and chunk responses and summary of each category.
+        checkpoint is written after each completed unit. a resumed run skips units whose inputs match by hash.
+        checkpoint of other milestone or template is not resumed. changed summarizer settings drop stored responses and summaries
+    """
+
+    def __init__(self, checkpoint_dir: Path, resume: bool, milestone_title: str, template_hash: str, summarizer_hash: str):
+        self.checkpoint_path = checkpoint_dir/CHECKPOINT_FILE_NAME
+        self.issues_path = checkpoint_dir/ISSUES_FILE_NAME
+        self.current = CheckpointModel(milestone_title=milestone_title, template_hash=template_hash, summarizer_hash=summarizer_hash)
+        self.stats = CheckpointStatsModel()
+        self.lock = Lock()
+        if resume:
+            self.load()
+
+    def load(self):
+        try:
+            stored = CheckpointModel.model_validate_json(self.checkpoint_path.read_text(encoding="utf-8"))
+        except (OSError, ValueError) as e:
+            print(f"checkpoint [{self.checkpoint_path}] can not be resumed, starting from scratch. error: {e}")
+            return
+        if stored.version != CHECKPOINT_VERSION or stored.milestone_title != self.current.milestone_title or stored.template_hash != self.current.template_hash:
+            print(f"checkpoint [{self.checkpoint_path}] is of other version, milestone or template, starting from scratch")
+            return
+        try:
+            if len(stored.issues_hash) > 0 and get_text_hash(self.issues_path.read_text(encoding="utf-8")) == stored.issues_hash:
+                self.current.issues_hash = stored.issues_hash
+        except OSError:
+            pass
+        if stored.summarizer_hash != self.current.summarizer_hash:
+            print("summarizer settings are changed since checkpoint, stored responses and summaries are not resumed")
+            return
+        self.current.categories = stored.categories
+        print(f"resuming checkpoint [{self.checkpoint_path}] with {len(stored.categories)} categories")
+
+    def save(self):
+        with self.lock:
+            write_atomic(self.checkpoint_path, self.current.model_dump_json())
+
+    def get_issues(self) -> Optional[Tuple[MilestoneModel, List[List[IssueModel]]]]:
+        """
+            returns milestone and issues of each category, when issues file of checkpoint is verified by its hash
+        """
+        if len(self.current.issues_hash) == 0:
+            return None
+        try:
+            issues_text = self.issues_path.read_text(encoding="utf-8")
+            if get_text_hash(issues_text) != self.current.issues_hash:
+                return None
+            stored_issues = CheckpointIssuesModel.model_validate_json(issues_text)
+        except (OSError, ValueError):
+            return None
+        self.stats.resumed_issues = True
+        print(f"resuming fetched issues of milestone [{stored_issues.milestone.title}] from checkpoint")
+        return stored_issues.milestone, stored_issues.category_issues
+
+    def set_issues(self, milestone: MilestoneModel, category_issues: List[List[IssueModel]]):
+        issues_text = CheckpointIssuesModel(milestone=milestone, category_issues=category_issues).model_dump_json()
+        write_atomic(self.issues_path, issues_text)
+        with self.lock:
+            self.current.issues_hash = get_text_hash(issues_text)
+        self.save()
+
+    def get_category(self, category_title: str):
+        with self.lock:
+            return self.current.categories.setdefault(category_title, CheckpointCategoryModel())
+
+    def get_summary(self, category_title: str, fingerprint: str) -> Optional[str]:
+        category = self.get_category(category_title)
+        if category.summary is None or category.fingerprint != fingerprint:
+            return None
+        with self.lock:
+            self.stats.resumed_summaries += 1
+        print(f"category [{category_title}] is completed in checkpoint, resuming stored summary")
+        return category.summary
+
+    def set_summary(self, category_title: str, fingerprint: str, summary: str):
+        category = self.get_category(category_title)
+        with self.lock:
+            category.fingerprint = fingerprint
+            category.summary = summary
+        self.save()
+
+    def get_category_checkpoint(self, category_title: str):
+        return CategoryCheckpoint(self, category_title)
+
+    def print_stats(self):
+        with self.lock:
+            print(f"checkpoint [{self.checkpoint_path}]: resumed issues={self.stats.resumed_issues}, "
+                  f"resumed summaries={self.stats.resumed_summaries}, resumed responses={self.stats.resumed_responses}")
+
+
+class CategoryCheckpoint:
+    """
+        llm responses of one category in run checkpoint. responses are verified by hash of their prompt
+    """
+
+    def __init__(self, run_checkpoint: RunCheckpoint, category_title: str):
+        self.run_checkpoint = run_checkpoint
+        self.category = run_checkpoint.get_category(category_title)
+
+    def get_response(self, prompt: str) -> Optional[str]:
+        with self.run_checkpoint.lock:
+            response_text = self.category.responses.get(get_text_hash(prompt))
+            if response_text is not None:
+                self.run_checkpoint.stats.resumed_responses += 1
+        return response_text
+
+    def set_response(self, prompt: str, response_text: str):
+        with self.run_checkpoint.lock:
+            self.category.responses[get_text_hash(prompt)] = response_text
+        self.run_checkpoint.save()
+
+
+def create_run_checkpoint(template_dict: Dict, summarizer_hash: str, milestone_title: Optional[str] = None):
+    """
+        RELEASE_RESUME=true resumes stored checkpoint, otherwise run starts a new checkpoint.
+        checkpoint directory is RELEASE_CHECKPOINT_DIR env, specific to milestone when milestone title is provided
+    """
+    checkpoint_dir = Path(get_optional_env_value("RELEASE_CHECKPOINT_DIR", str(rootpath/"dist/checkpoint")))
+    if milestone_title is not None:
+        checkpoint_dir = checkpoint_dir/get_safe_name(milestone_title)
+    template_hash = get_text_hash(json.dumps(template_dict, sort_keys=True, default=str))
+    return RunCheckpoint(checkpoint_dir=checkpoint_dir,
+                         resume=get_env_bool_value("RELEASE_RESUME"),
+                         milestone_title=milestone_title if milestone_title is not None else get_env_value("MILESTONE_TITLE"),
+                         template_hash=template_hash,
+                         summarizer_hash=summarizer_hash)
@@ -0,0 +1,94 @@
+import math
+import re
+from typing import List, Tuple
+from pydantic import BaseModel
+from .prompt_serializer import get_compact_commits, get_compact_text
+from ..genai.tokens import TRUNCATION_MARKER
+from ..utils import get_env_int_value
+
+
+# comments with only these are triage noise, they are never selected
+NOISE_COMMENT_REGEX = re.compile(r"^(\+1|-1|same( here| issue)?|me too|bump|any updates?|thanks?( you)?|ty|ok(ay)?|done|fixed|closing)[\s.!?]*$", re.IGNORECASE)
+AUTHOR_ASSOCIATION_WEIGHTS = {
+    "OWNER": 2.0,
+    "MEMBER": 2.0,
+    "COLLABORATOR": 2.0,
+    "CONTRIBUTOR": 1.5,
+}
+# comment of this many chars gets full length weight, shorter ones are weighted down
+FULL_WEIGHT_COMMENT_CHARS = 400
+# comment is truncated to fit remaining budget only when at least this many bytes remain
+MIN_TRUNCATED_COMMENT_BYTES = 100
+
+
+class CommentCandidateModel(BaseModel):
+    text: str
+    author_association: str
+    reactions: int
+    # position in fetched comments, 0 is oldest
+    position: int
+
+
+def get_byte_size(text: str):
+    return len(text.encode("utf-8"))
+
+
+def get_truncated_text(text: str, max_bytes: int):
+    """
+        text cut to max bytes including truncation marker, without splitting a utf-8 char. cuts at last whitespace when possible
+    """
+    cut_bytes = max(0, max_bytes - get_byte_size(TRUNCATION_MARKER))
+    cut_text = text.encode("utf-8")[:cut_bytes].decode("utf-8", errors="ignore")
+    whitespace_index = cut_text.rfind(" ")
+    if whitespace_index > len(cut_text) * 0.8:
+        cut_text = cut_text[:whitespace_index]
+    return cut_text.rstrip() + TRUNCATION_MARKER
+
+
+def get_comment_score(candidate: CommentCandidateModel, candidate_count: int):
+    """
+        local relevance of comment. maintainer comments, reacted comments, longer comments and later comments score higher.
+        noise comments score 0
+    """
+    if len(candidate.text) == 0 or NOISE_COMMENT_REGEX.match(candidate.text):
+        return 0.0
+    author_weight = AUTHOR_ASSOCIATION_WEIGHTS.get(candidate.author_association, 1.0)
+    reaction_weight = 1 + math.log1p(candidate.reactions)
+    length_weight = min(1.0, math.log1p(len(candidate.text)) / math.log1p(FULL_WEIGHT_COMMENT_CHARS))
+    # resolving discussion tends to be at the end of thread
+    recency_weight = 0.5 + 0.5 * candidate.position / max(1, candidate_count - 1)
+    return author_weight * reaction_weight * length_weight * recency_weight
+
+
+def select_issue_context(comment_candidates: List[CommentCandidateModel], commits: List[str]) -> Tuple[List[str], List[str]]:
+    """
+        keeps distinct commit messages and highest scored comments within per issue byte budget of RELEASE_ISSUE_CONTEXT_BYTES env.
+        commits may use up to half of the budget, comments fill the rest. selected items are returned in chronological order.
+        highest scored comment, which doesnt fit in remaining budget, is truncated to it instead of being left out
+    """
+    byte_budget = get_env_int_value("RELEASE_ISSUE_CONTEXT_BYTES", default_value=2000, min_value=0)
+    remaining_bytes = byte_budget // 2
+    selected_commits: List[str] = []
+    for commit in get_compact_commits(commits):
+        commit_bytes = get_byte_size(commit)
+        if commit_bytes <= remaining_bytes:
+            selected_commits.append(commit)
+            remaining_bytes -= commit_bytes
+    remaining_bytes += byte_budget - byte_budget // 2
+
+    compact_candidates = [candidate.model_copy(update={"text": get_compact_text(candidate.text)}) for candidate in comment_candidates]
+    scored_candidates = [(get_comment_score(candidate, len(compact_candidates)), candidate) for candidate in compact_candidates]
+    selected_candidates: List[CommentCandidateModel] = []
+    for score, candidate in sorted(scored_candidates, key=lambda scored: -scored[0]):
+        candidate_bytes = get_byte_size(candidate.text)
+        if score <= 0:
+            continue
+        if candidate_bytes <= remaining_bytes:
+            selected_candidates.append(candidate)
+            remaining_bytes -= candidate_bytes
+        elif remaining_bytes >= MIN_TRUNCATED_COMMENT_BYTES:
+            truncated_text = get_truncated_text(candidate.text, remaining_bytes)
+            selected_candidates.append(candidate.model_copy(update={"text": truncated_text}))
+            remaining_bytes -= get_byte_size(truncated_text)
+    selected_comments = [candidate.text for candidate in sorted(selected_candidates, key=lambda candidate: candidate.position)]
+    return selected_comments, selected_commits
@@ -0,0 +1,166 @@
+from pathlib import Path
+import re
+import subprocess
+from threading import Lock
+from typing import Dict, List, Optional
+from pydantic import BaseModel, Field
+from ..utils import get_optional_env_value, get_safe_name, rootpath, tracing, write_atomic
+
+
+# matches `#12`, `fixes #12`, `closes #12` and `resolves #12`. cross repository references like `owner/repo#12` are skipped
+ISSUE_REFERENCE_REGEX = re.compile(r"(?<![\w/&])#(\d+)\b")
+GIT_FIELD_SEPARATOR = "\x1f"
+GIT_RECORD_SEPARATOR = "\x1e"
+
+
+class GitIndexModel(BaseModel):
+    git_range: str
+    last_commit: str
+    issue_commits: Dict[int, List[str]] = Field(default_factory=dict)
+
+
+# indexes built in this process by git range, milestones of a run can have different ranges
+git_indexes: Dict[str, GitIndexModel] = {}
+git_index_lock = Lock()
+
+
+def run_git(*args: str):
+    result = subprocess.run(["git", "-C", str(rootpath), *args], capture_output=True, text=True, encoding="utf-8")
+    if result.returncode != 0:
+        raise ValueError(f"git {" ".join(args)} failed. {result.stderr.strip()}")
+    return result.stdout
+
+
+def get_previous_tag(ref: str) -> Optional[str]:
+    try:
+        return run_git("describe", "--tags", "--abbrev=0", ref).strip()
+    except ValueError:
+        return None
+
+
+def get_milestone_tag(milestone_title: str) -> Optional[str]:
+    """
+        tag of released milestone, named as milestone title with or without `v` prefix
+    """
+    for tag_name in dict.fromkeys([milestone_title, f"v{milestone_title}", milestone_title.removeprefix("v")]):
+        try:
+            run_git("rev-parse", "--verify", "--quiet", f"refs/tags/{tag_name}")
+            return tag_name
+        except ValueError:
+            continue
+    return None
+
+
+def get_git_range(milestone_title: str):
+    """
+        range of milestone commits. RELEASE_GIT_RANGE env applies to every milestone of run.
+        released milestone has commits from previous tag to its tag, otherwise commits since last tag.
+        requires full history checkout
+    """
+    git_range = get_optional_env_value("RELEASE_GIT_RANGE", "")
+    if len(git_range) > 0:
+        return git_range
+    milestone_tag = get_milestone_tag(milestone_title)
+    end_ref = milestone_tag if milestone_tag is not None else "HEAD"
+    start_tag = get_previous_tag(f"{milestone_tag}^" if milestone_tag is not None else "HEAD")
+    if start_tag is None:
+        print(f"there is no tag before [{end_ref}] in git history, indexing all commits")
+        return end_ref
+    return f"{start_tag}..{end_ref}"
+
+
+def get_end_ref(git_range: str):
+    """
+        last ref of range, e.g. `v1.2` of `v1.1..v1.2`. open ended range ends at HEAD
+    """
+    end_ref = git_range.split("..")[-1].lstrip(".")
+    return end_ref if len(end_ref) > 0 else "HEAD"
+
+
+def get_index_path(git_range: str):
+    index_dir = Path(get_optional_env_value("RELEASE_GIT_INDEX_DIR", str(rootpath/"dist/git-index")))
+    return index_dir/f"{get_safe_name(git_range)}.json"
+
+
+def get_issue_numbers(commit_message: str):
+    return list(dict.fromkeys(int(num) for num in ISSUE_REFERENCE_REGEX.findall(commit_message)))
+
+
+def scan_commits(git_range: str, issue_commits: Dict[int, List[str]]):
+    """
+        adds messages of non merge commits in range to referenced issues. returns number of scanned commits
+    """
+    git_log = run_git("log", "--no-merges", f"--format=%H{GIT_FIELD_SEPARATOR}%B{GIT_RECORD_SEPARATOR}", git_range)
+    commit_count = 0
+    # git log lists newest commits first, commits are kept in chronological order
+    for record in reversed(git_log.split(GIT_RECORD_SEPARATOR)):
+        if GIT_FIELD_SEPARATOR not in record:
+            continue
+        commit_message = record.split(GIT_FIELD_SEPARATOR, 1)[1].strip()
+        commit_count += 1
+        for issue_number in get_issue_numbers(commit_message):
+            issue_commits.setdefault(issue_number, []).append(commit_message)
+    return commit_count
+
+
+def load_stored_index(index_path: Path) -> Optional[GitIndexModel]:
+    try:
+        return GitIndexModel.model_validate_json(index_path.read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return None
+
+
+def is_ancestor_commit(commit: str, head_commit: str):
+    try:
+        run_git("merge-base", "--is-ancestor", commit, head_commit)
+        return True
+    except ValueError:
+        return False
+
+
+def store_index(index_path: Path, index: GitIndexModel):
+    write_atomic(index_path, index.model_dump_json())
+
+
+@tracing.traced("build_git_index")
+def build_git_index(git_range: str):
+    """
+        scans git log once for milestone range.
+        stored index of same range is reused and only commits after its last indexed commit are scanned
+    """
+    end_commit = run_git("rev-parse", get_end_ref(git_range)).strip()
+    index_path = get_index_path(git_range)
+    stored_index = load_stored_index(index_path)
+
+    if stored_index is not None and stored_index.git_range == git_range and stored_index.last_commit == end_commit:
+        print(f"git index is up to date at commit [{end_commit[:12]}]")
+        return stored_index
+
+    if stored_index is not None and stored_index.git_range == git_range and is_ancestor_commit(stored_index.last_commit, end_commit):
+        index = stored_index.model_copy(update={"last_commit": end_commit})
+        commit_count = scan_commits(f"{stored_index.last_commit}..{end_commit}", index.issue_commits)
+        print(f"git index is updated incrementally with {commit_count} commits after [{stored_index.last_commit[:12]}]")
+    else:
+        index = GitIndexModel(git_range=git_range, last_commit=end_commit)
+        commit_count = scan_commits(git_range, index.issue_commits)
+        print(f"git index is built from {commit_count} commits of range [{git_range}]")
+
+    tracing.add_span_attributes(commits=commit_count, issues=len(index.issue_commits))
+    store_index(index_path, index)
+    return index
+
+
+def get_issue_commits(milestone_title: str) -> Dict[int, List[str]]:
+    """
+        commit messages of milestone range by referenced issue number. index of a range is built once per process.
+        commits are optional context, when git or its history is not available, issues have no commits
+    """
+    with git_index_lock:
+        try:
+            git_range = get_git_range(milestone_title)
+            if git_range not in git_indexes:
+                git_indexes[git_range] = build_git_index(git_range)
+            return git_indexes[git_range].issue_commits
+        except (OSError, ValueError) as e:
+            print(f"warning: git index of milestone [{milestone_title}] is not available, issues have no commits. error: {e}")
+            return {}
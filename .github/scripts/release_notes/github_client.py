@@ -0,0 +1,178 @@
+from datetime import datetime, timezone
+import math
+from threading import BoundedSemaphore, Lock
+import time
+from typing import Any, Callable, Dict, Iterable, Optional, Tuple
+from pydantic import BaseModel
+import requests
+from ..utils import get_env_int_value, get_env_value, tracing
+from ..utils.json_stream import decode_json_stream
+
+
+RATE_LIMIT_QUERY_PART = """
+    rateLimit {
+        cost
+        remaining
+        resetAt
+        limit
+    }
+"""
+
+
+# response body is read in chunks of this size when streamed
+STREAM_CHUNK_BYTES = 64 * 1024
+
+
+class RateLimitModel(BaseModel):
+    cost: int
+    remaining: int
+    resetAt: str
+    limit: int
+
+
+class GithubStatsModel(BaseModel):
+    requests: int = 0
+    cost: int = 0
+    waited_seconds: float = 0
+
+
+class GithubGraphqlClient:
+    """
+        graphql client with shared http session. every query requests rateLimit, so the point budget is tracked across calls.
+        before each page, cost of the remaining pages is predicted from observed cost per page, and cost of the page is reserved
+        until its response reports the remaining points, so concurrent workers do not spend the same points.
+        when the budget can not cover it, the request waits for the budget reset if reset is near, otherwise fails fast with the estimate.
+    """
+
+    def __init__(self, graphql_url: str, github_token: str, max_concurrency: int, reserve_points: int, max_wait_seconds: int):
+        self.graphql_url = graphql_url
+        self.session = requests.Session()
+        self.session.headers.update({
+            "Authorization": f"Bearer {github_token}",
+            "Content-Type": "application/json",
+        })
+        # github secondary limits penalize too many concurrent requests
+        self.semaphore = BoundedSemaphore(max_concurrency)
+        self.reserve_points = reserve_points
+        self.max_wait_seconds = max_wait_seconds
+        self.rate_limit: Optional[RateLimitModel] = None
+        self.cost_per_page = 1
+        # points of in flight requests, not yet reflected in remaining points of rate limit
+        self.reserved_points = 0
+        self.stats = GithubStatsModel()
+        self.lock = Lock()
+
+    def get_reset_seconds(self):
+        if self.rate_limit is None:
+            return 0.0
+        reset_at = datetime.fromisoformat(self.rate_limit.resetAt.replace("Z", "+00:00"))
+        return max(0.0, (reset_at - datetime.now(timezone.utc)).total_seconds())
+
+    def ensure_budget(self, pages: int, description: str) -> int:
+        """
+            reserves cost of next page and returns the reserved points, which are handed to query_stream of the page.
+            waits for budget reset or raises error, if the remaining points, less points reserved by in flight requests, can not cover cost of the pages
+        """
+        with self.lock:
+            predicted_cost = pages * self.cost_per_page
+            if self.rate_limit is None or self.rate_limit.remaining - self.reserved_points - predicted_cost >= self.reserve_points:
+                self.reserved_points += self.cost_per_page
+                return self.cost_per_page
+            remaining_points = self.rate_limit.remaining
+            reserved_points = self.reserved_points
+            limit_points = self.rate_limit.limit
+        reset_seconds = self.get_reset_seconds()
+        if predicted_cost + self.reserve_points > limit_points or reset_seconds > self.max_wait_seconds:
+            raise ValueError(f"github graphql budget can not cover [{description}]. estimated cost of {pages} pages is {predicted_cost} points, "
+                             f"remaining {remaining_points} of {limit_points} points with {reserved_points} points reserved by in flight requests "
+                             f"and reserve of {self.reserve_points} points, budget resets in {reset_seconds:.0f} seconds")
+        print(f"github graphql budget is low for [{description}], estimated cost {predicted_cost} points, remaining {remaining_points} points, "
+              f"reserved {reserved_points} points. waiting {reset_seconds:.0f} seconds for budget reset")
+        time.sleep(reset_seconds)
+        with self.lock:
+            self.stats.waited_seconds += reset_seconds
+            self.rate_limit = None
+            self.reserved_points += self.cost_per_page
+            return self.cost_per_page
+
+    def release_budget(self, reserved_points: int):
+        with self.lock:
+            self.reserved_points -= reserved_points
+
+    def query_stream(self, graphql_query: str, variables: Dict[str, Any], array_path: Tuple[str, ...], on_item: Callable[[Any], None],
+                     reserved_points: int = 0) -> Dict[str, Any]:
+        """
+            graphql query must include rateLimit query part. returns data dict of response.
+            response body is decoded while it is downloaded. elements of array at array path of data
+            are handed to on_item one at a time, and are left out of returned data dict.
+            reserved points of ensure_budget are released when the response reports remaining points, or when the request fails
+        """
+        response_size = {"bytes": 0}
+
+        def count_chunks(chunks: Iterable[bytes]):
+            for chunk in chunks:
+                response_size["bytes"] += len(chunk)
+                yield chunk
+
+        try:
+            with self.semaphore:
+                response = self.session.post(self.graphql_url, json={"query": graphql_query, "variables": variables}, stream=True)
+                try:
+                    print("graphql response: ", response)
+                    response.raise_for_status()  # Raise an exception for HTTP errors
+                    response_json, item_count = decode_json_stream(count_chunks(response.iter_content(chunk_size=STREAM_CHUNK_BYTES)),
+                                                                   ("data",) + array_path, on_item)
+                finally:
+                    response.close()
+        except BaseException:
+            self.release_budget(reserved_points)
+            raise
+        tracing.add_span_attributes(bytes=response_size["bytes"], items=item_count)
+        return self.get_response_data(response_json, reserved_points)
+
+    def get_response_data(self, response_json: Dict[str, Any], reserved_points: int = 0) -> Dict[str, Any]:
+        """
+            reservation of the request is released together with update of rate limit, so its cost is counted once.
+            responses of concurrent requests may arrive out of order, so rate limit of a later budget window, or fewer remaining points of same window, wins
+        """
+        response_data = response_json.get("data") or {}
+        rate_limit = RateLimitModel.model_validate(response_data["rateLimit"]) if response_data.get("rateLimit") is not None else None
+        with self.lock:
+            self.reserved_points -= reserved_points
+            if rate_limit is not None:
+                if self.rate_limit is None or (rate_limit.resetAt, -rate_limit.remaining) > (self.rate_limit.resetAt, -self.rate_limit.remaining):
+                    self.rate_limit = rate_limit
+                self.cost_per_page = max(self.cost_per_page, rate_limit.cost)
+                self.stats.requests += 1
+                self.stats.cost += rate_limit.cost
+        if rate_limit is not None:
+            tracing.add_span_attributes(cost=rate_limit.cost)
+        if "errors" in response_json:
+            raise ValueError(f"graphql query failed with errors: {response_json["errors"]}")
+        return response_data
+
+    def print_stats(self):
+        with self.lock:
+            remaining_points = self.rate_limit.remaining if self.rate_limit is not None else "NA"
+            print(f"github graphql: requests={self.stats.requests}, cost={self.stats.cost} points, cost per page={self.cost_per_page}, "
+                  f"remaining={remaining_points} points, waited={self.stats.waited_seconds:.0f} seconds")
+
+
+def get_page_count(total_count: int, page_size: int):
+    return math.ceil(total_count / page_size)
+
+
+github_client: Optional[GithubGraphqlClient] = None
+github_client_lock = Lock()
+
+
+def get_github_client():
+    global github_client
+    with github_client_lock:
+        if github_client is None:
+            github_client = GithubGraphqlClient(graphql_url=get_env_value("GITHUB_GRAPHQL_URL"),
+                                                github_token=get_env_value("GH_TOKEN"),
+                                                max_concurrency=get_env_int_value("GITHUB_GRAPHQL_CONCURRENCY", default_value=2),
+                                                reserve_points=get_env_int_value("GITHUB_GRAPHQL_RESERVE_POINTS", default_value=50, min_value=0),
+                                                max_wait_seconds=get_env_int_value("GITHUB_GRAPHQL_MAX_WAIT_SECONDS", default_value=120, min_value=0))
+    return github_client
@@ -0,0 +1,89 @@
+from typing import Dict, Iterable, List, Optional
+from .github_client import RATE_LIMIT_QUERY_PART
+from .models import CommentsModel, IssueModel
+
+
+# nested graphql selection, field with None is a leaf field
+Selection = Dict[str, Optional[Dict]]
+
+COMMENTS_FIELD_SELECTIONS: Dict[str, Selection] = {
+    "total": {"totalCount": None},
+    "top_prioritized": {"nodes": {"bodyText": None, "authorAssociation": None, "reactions": {"totalCount": None}}},
+}
+ISSUE_FIELD_SELECTIONS: Dict[str, Selection] = {
+    "number": {"number": None},
+    "title": {"title": None},
+    "body": {"bodyText": None},
+    "updated_at": {"updatedAt": None},
+    "labels": {"labels(first: 20)": {"nodes": {"name": None}}},
+    "milestone_number": {"milestone": {"number": None}},
+}
+# issue fields computed locally, not fetched from github
+LOCAL_ISSUE_FIELDS = {"commits", "primary_category", "related_numbers"}
+
+
+def merge_selections(selections: Iterable[Selection]):
+    merged_selection: Selection = {}
+    for selection in selections:
+        for field, sub_selection in selection.items():
+            if sub_selection is None or merged_selection.get(field) is None:
+                merged_selection.setdefault(field, sub_selection)
+            else:
+                merged_selection[field] = merge_selections([merged_selection[field], sub_selection])
+    return merged_selection
+
+
+def get_issue_selection(comment_count: int, issue_fields: Optional[Iterable[str]] = None):
+    """
+        graphql selection of issue node for the IssueModel fields a use site consumes, all fetched fields by default.
+        every model field must have a selection or be local, so a new model field can not be silently left unfetched
+    """
+    unmapped_fields = set(IssueModel.model_fields) - set(ISSUE_FIELD_SELECTIONS) - LOCAL_ISSUE_FIELDS - {"comments"}
+    unmapped_fields |= set(CommentsModel.model_fields) - set(COMMENTS_FIELD_SELECTIONS)
+    if len(unmapped_fields) > 0:
+        raise ValueError(f"model fields {sorted(unmapped_fields)} have no graphql selection")
+
+    field_names = list(issue_fields) if issue_fields is not None else list(IssueModel.model_fields)
+    selections: List[Selection] = []
+    for field_name in field_names:
+        if field_name not in IssueModel.model_fields:
+            raise ValueError(f"[{field_name}] is not field of issue model")
+        if field_name == "comments":
+            comments_selection = merge_selections(COMMENTS_FIELD_SELECTIONS[name] for name in CommentsModel.model_fields)
+            selections.append({f"comments(last: {comment_count})": comments_selection})
+        elif field_name not in LOCAL_ISSUE_FIELDS:
+            selections.append(ISSUE_FIELD_SELECTIONS[field_name])
+    return merge_selections(selections)
+
+
+def get_selection_text(selection: Selection):
+    return " ".join(field if sub_selection is None else f"{field} {{ {get_selection_text(sub_selection)} }}"
+                    for field, sub_selection in selection.items())
+
+
+def build_issue_search_query(page_size: int, issue_selection: Selection):
+    """
+        search query of issues with $searchQuery and $cursor variables
+    """
+    return (f"query ($searchQuery: String!, $cursor: String) {{ "
+            f"search(query: $searchQuery, type: ISSUE, first: {page_size}, after: $cursor) {{ "
+            f"issueCount pageInfo {{ hasNextPage endCursor }} nodes {{ ... on Issue {{ {get_selection_text(issue_selection)} }} }} }} "
+            f"{' '.join(RATE_LIMIT_QUERY_PART.split())} }}")
+
+
+def get_quoted_search_value(value: str):
+    """
+        quoted value of search qualifier. backslash and double quote are escaped
+    """
+    escaped_value = value.replace("\\", "\\\\").replace('"', '\\"')
+    return f'"{escaped_value}"'
+
+
+def get_search_qualifier(qualifier: str, values: Iterable[str], is_excluded: bool = False):
+    """
+        qualifier matching any of values, e.g. label:"bug","help wanted". empty string when there are no values
+    """
+    sorted_values = sorted(set(values))
+    if len(sorted_values) == 0:
+        return ""
+    return f'{"-" if is_excluded else ""}{qualifier}:{",".join(get_quoted_search_value(value) for value in sorted_values)}'
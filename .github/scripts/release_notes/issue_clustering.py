@@ -0,0 +1,105 @@
+from typing import List
+import numpy as np
+from .models import IssueModel
+from . import prompt_serializer
+from ..genai import tokens
+from ..utils import get_env_bool_value, get_env_float_value, get_env_int_value, tracing
+
+
+# odd multiplier of multiplicative hashing, keeps trigram buckets same across runs unlike python hash
+TRIGRAM_HASH_MULTIPLIER = np.uint32(2654435761)
+
+
+def get_issue_text(issue: IssueModel):
+    return f"{issue.title} {prompt_serializer.get_compact_text(issue.body, strip_boilerplate=True)}".lower()
+
+
+def get_term_count_matrix(texts: List[str], feature_bits: int):
+    """
+        counts of hashed utf-8 byte trigrams of each text. all texts are hashed and counted in one vectorized pass
+    """
+    encoded_texts = [text.encode("utf-8") for text in texts]
+    text_lengths = np.array([len(encoded_text) for encoded_text in encoded_texts], dtype=np.int64)
+    all_bytes = np.frombuffer(b"".join(encoded_texts), dtype=np.uint8).astype(np.uint32)
+    feature_count = 1 << feature_bits
+    if len(all_bytes) < 3:
+        return np.zeros((len(texts), feature_count), dtype=np.float32)
+
+    row_ids = np.repeat(np.arange(len(texts), dtype=np.int64), text_lengths)
+    # trigram is counted only when all 3 bytes belong to same text
+    is_same_text = row_ids[:-2] == row_ids[2:]
+    trigrams = ((all_bytes[:-2] << 16) | (all_bytes[1:-1] << 8) | all_bytes[2:])[is_same_text]
+    buckets = (trigrams * TRIGRAM_HASH_MULTIPLIER) >> np.uint32(32 - feature_bits)
+    cell_ids = row_ids[:-2][is_same_text] * feature_count + buckets
+    term_counts = np.bincount(cell_ids, minlength=len(texts) * feature_count)
+    return term_counts.reshape(len(texts), feature_count).astype(np.float32)
+
+
+def get_tfidf_matrix(texts: List[str], feature_bits: int):
+    """
+        rows are l2 normalized sublinear tf-idf vectors, so dot product is cosine similarity
+    """
+    term_counts = get_term_count_matrix(texts, feature_bits)
+    document_frequency = np.count_nonzero(term_counts, axis=0)
+    idf = np.log((1 + len(texts)) / (1 + document_frequency)) + 1
+    tfidf = np.log1p(term_counts) * idf.astype(np.float32)
+    norms = np.linalg.norm(tfidf, axis=1, keepdims=True)
+    return tfidf / np.maximum(norms, 1e-12)
+
+
+def get_similar_matrix(tfidf: np.ndarray, threshold: float, block_size: int = 1024):
+    """
+        boolean matrix of pairs with cosine similarity at or above threshold. computed in row blocks to bound memory
+    """
+    similar = np.zeros((tfidf.shape[0], tfidf.shape[0]), dtype=bool)
+    for start in range(0, tfidf.shape[0], block_size):
+        similar[start:start+block_size] = (tfidf[start:start+block_size] @ tfidf.T) >= threshold
+    return similar
+
+
+@tracing.traced("cluster_issues")
+def cluster_issues(category_title: str, issues: List[IssueModel]):
+    """
+        groups near duplicate issues by similarity of title and body. first issue of each cluster is its representative
+        and carries numbers of other members, the members are not sent to llm.
+        clustering is opt in by RELEASE_CLUSTER_ISSUES=true, since merged issues lose their own text in summary.
+        default threshold merges only reports with nearly same text, issues differing by a word stay separate.
+        cross referenced issues are not clustered
+    """
+    if not get_env_bool_value("RELEASE_CLUSTER_ISSUES", default_value=False):
+        return issues
+    threshold = get_env_float_value("RELEASE_CLUSTER_SIMILARITY", default_value=0.95)
+    feature_bits = get_env_int_value("RELEASE_CLUSTER_FEATURE_BITS", default_value=11, min_value=8)
+    candidate_indices = [ind for ind, issue in enumerate(issues) if len(issue.primary_category) == 0]
+    if len(candidate_indices) < 2:
+        return issues
+
+    tfidf = get_tfidf_matrix([get_issue_text(issues[ind]) for ind in candidate_indices], feature_bits)
+    similar = get_similar_matrix(tfidf, threshold)
+    is_assigned = np.zeros(len(candidate_indices), dtype=bool)
+    related_numbers = {}
+    member_indices = set()
+    for position, issue_index in enumerate(candidate_indices):
+        if is_assigned[position]:
+            continue
+        cluster_positions = np.flatnonzero(similar[position] & ~is_assigned)
+        is_assigned[cluster_positions] = True
+        other_indices = [candidate_indices[pos] for pos in cluster_positions if pos != position]
+        if len(other_indices) > 0:
+            related_numbers[issue_index] = [issues[ind].number for ind in other_indices]
+            member_indices.update(other_indices)
+
+    clustered_issues: List[IssueModel] = []
+    for ind, issue in enumerate(issues):
+        if ind in member_indices:
+            continue
+        if ind in related_numbers:
+            issue = issue.model_copy(update={"related_numbers": related_numbers[ind]})
+        clustered_issues.append(issue)
+
+    saved_tokens = (tokens.estimate_tokens(prompt_serializer.dump_prompt_issues(issues))
+                    - tokens.estimate_tokens(prompt_serializer.dump_prompt_issues(clustered_issues)))
+    print(f"category [{category_title}] clustered {len(issues)} issues into {len(clustered_issues)} with similarity threshold [{threshold}]. "
+          f"merged {len(member_indices)} near duplicate issues, saved about {saved_tokens} estimated prompt tokens")
+    tracing.add_span_attributes(category=category_title, issues=len(issues), clustered=len(clustered_issues), saved_tokens=saved_tokens)
+    return clustered_issues
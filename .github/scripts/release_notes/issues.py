@@ -1,104 +1,183 @@
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
 from operator import le
-from typing import List, Optional
-import requests
-from .models import CategoryModel, CommentsModel, IssueModel
-from ..utils import get_env_value
+from typing import Dict, Iterable, List, Optional, Tuple
+from .context_selection import CommentCandidateModel, select_issue_context
+from .git_index import get_issue_commits
+from .github_client import get_github_client, get_page_count
+from .graphql_query import build_issue_search_query, get_issue_selection, get_search_qualifier
+from .models import CategoryModel, CommentsModel, IssueModel, MilestoneModel
+from ..utils import get_env_int_value, get_env_value, tracing
 
 
+# labels and milestone are used only by local category assignment of milestone issues
+CATEGORY_ISSUE_FIELDS = ("number", "title", "body", "comments", "updated_at")
+
+
+@tracing.traced("get_issues")
 def get_issues(category: CategoryModel, generic_exclude_labels: Optional[List[str]]):
     exclude_labels1 = category.labels.exclude if category.labels.exclude is not None else []
     exclude_labels2 = generic_exclude_labels if generic_exclude_labels is not None else []
     unique_exclude_labels = [el for el in set(exclude_labels1+exclude_labels2)]
     print("exclude labels: ", unique_exclude_labels)
     include_labels = category.labels.include if category.labels.include is not None else []
-    gql_issues = fetch_issues_by_labels(include_labels, unique_exclude_labels)
-    if not isinstance(gql_issues, List):
-        raise ValueError("graphql response is not list")
-
-    converted_issues: List[IssueModel] = []
-    for gql_issue in gql_issues:
-        issue = IssueModel(
-            number=gql_issue["number"],
-            title=gql_issue["title"],
-            body=gql_issue["bodyText"],
-            comments=CommentsModel(
-                total=gql_issue["comments"]["totalCount"],
-                top_prioritized=[cb["bodyText"] for cb in gql_issue["comments"]["nodes"]]
-            ),
-            commits=[ti_edge["node"]["commit"]["message"] for ti_edge in gql_issue["timelineItems"]["edges"]]
-        )
-        converted_issues.append(issue)
+    tracing.add_span_attributes(category=category.title)
+    converted_issues = fetch_issues_by_labels(include_labels, unique_exclude_labels, issue_fields=CATEGORY_ISSUE_FIELDS)
+    tracing.add_span_attributes(issues=len(converted_issues))
     return converted_issues
 
 
-def fetch_issues_by_labels(include_labels: List[str], exclude_labels: List[str]):
-    include_labels_joined = ""
-    unique_include_labels = set(include_labels)-set(exclude_labels)
-    if len(unique_include_labels) > 0:
-        include_labels_joined = '\\"'+'\\",\\"'.join(unique_include_labels)+'\\"'
-
-    exclude_labels_query_part = ""
-    if len(exclude_labels) > 0:
-        exclude_labels_joined = '\\"'+'\\",\\"'.join(exclude_labels)+'\\"'
-        exclude_labels_query_part = "-label:"+exclude_labels_joined
-
-    graphql_query = f"""
-    query {{
-        search(
-            query: "repo:{get_env_value("GITHUB_REPOSITORY")} is:issue milestone:\\"{get_env_value("MILESTONE_TITLE")}\\" label:{include_labels_joined} {exclude_labels_query_part} "
-            type: ISSUE
-            first: 100
-        ) {{
-            issueCount
-            nodes {{
-            __typename
-            ... on Issue {{
-                number
-                title
-                bodyText
-                comments(first: 3) {{
-                totalCount
-                    nodes {{
-                        bodyText
-                    }}
-                }}
-                labels(first: 10) {{
-                    nodes {{
-                        name
-                    }}
-                }}
-                timelineItems(first: 20, itemTypes: [REFERENCED_EVENT]) {{
-                totalCount
-                edges {{
-                    node {{
-                    __typename
-                    ... on ReferencedEvent {{
-                        commit {{
-                            message
-                        }}
-                    }}
-                    }}
-                }}
-                }}
-            }}
-            }}
-        }}
-    }}
+@tracing.traced("get_milestone_issues")
+def get_milestone_issues(generic_exclude_labels: Optional[List[str]], milestone_title: Optional[str] = None) -> Tuple[MilestoneModel, List[IssueModel]]:
+    """
+        fetches all issues of milestone once with their labels, so categories can be assigned locally.
+        milestone number is taken from the issues. milestone title defaults to MILESTONE_TITLE env
+    """
+    if milestone_title is None:
+        milestone_title = get_env_value("MILESTONE_TITLE")
+    exclude_labels = list(set(generic_exclude_labels)) if generic_exclude_labels is not None else []
+    print("exclude labels: ", exclude_labels)
+    converted_issues = fetch_issues_by_labels([], exclude_labels, milestone_title)
+    milestone_number = next((issue.milestone_number for issue in converted_issues if issue.milestone_number is not None), None)
+    tracing.add_span_attributes(milestone=milestone_title, issues=len(converted_issues))
+    return MilestoneModel(title=milestone_title, number=milestone_number), converted_issues
+
+
+def get_converted_issue(gql_issue: Dict, issue_commits: Dict[int, List[str]]):
+    """
+        converts graphql issue node as soon as it is decoded from response stream, so the node dict is not kept.
+        comments and commits are selected by relevance within issue byte budget
+    """
+    if not isinstance(gql_issue, Dict):
+        raise ValueError("graphql issue node is not dict")
+
+    comment_nodes = gql_issue["comments"]["nodes"]
+    comment_candidates = [CommentCandidateModel(text=cn["bodyText"],
+                                                author_association=cn.get("authorAssociation") or "NONE",
+                                                reactions=cn["reactions"]["totalCount"] if cn.get("reactions") is not None else 0,
+                                                position=ind)
+                          for ind, cn in enumerate(comment_nodes)]
+    selected_comments, selected_commits = select_issue_context(comment_candidates, issue_commits.get(gql_issue["number"], []))
+    return IssueModel(
+        number=gql_issue["number"],
+        title=gql_issue["title"],
+        body=gql_issue["bodyText"],
+        comments=CommentsModel(
+            total=gql_issue["comments"]["totalCount"],
+            top_prioritized=selected_comments
+        ),
+        commits=selected_commits,
+        updated_at=gql_issue.get("updatedAt") or "",
+        labels=[label_node["name"] for label_node in gql_issue["labels"]["nodes"]] if "labels" in gql_issue else [],
+        milestone_number=gql_issue["milestone"]["number"] if gql_issue.get("milestone") is not None else None
+    )
+
+
+ISSUES_PAGE_SIZE = 100
+# github search returns at most 1000 results of a query, even with pagination
+SEARCH_RESULT_LIMIT = 1000
+# github was launched in 2008, no issue is created before it
+SEARCH_START_TIME = datetime(2008, 1, 1, tzinfo=timezone.utc)
+SEARCH_DATE_FORMAT = "%Y-%m-%dT%H:%M:%SZ"
+
+
+@tracing.traced("fetch_issues_by_labels")
+def fetch_issues_by_labels(include_labels: List[str], exclude_labels: List[str], milestone_title: Optional[str] = None,
+                           issue_fields: Optional[Iterable[str]] = None):
+    """
+        query selects only graphql fields of issue fields, all fetched fields of IssueModel by default
     """
+    if milestone_title is None:
+        milestone_title = get_env_value("MILESTONE_TITLE")
+    # latest comments are fetched, resolving discussion is usually at the end of thread
+    comment_candidate_count = get_env_int_value("GITHUB_ISSUE_COMMENT_CANDIDATES", default_value=10)
+    search_query_parts = [f'repo:{get_env_value("GITHUB_REPOSITORY")}',
+                          "is:issue",
+                          get_search_qualifier("milestone", [milestone_title]),
+                          get_search_qualifier("label", set(include_labels) - set(exclude_labels)),
+                          get_search_qualifier("label", exclude_labels, is_excluded=True)]
+    search_query = " ".join(part for part in search_query_parts if len(part) > 0)
+    graphql_query = build_issue_search_query(ISSUES_PAGE_SIZE, get_issue_selection(comment_candidate_count, issue_fields))
     # print("gql query: ", graphql_query)
+    # git index is ready before streaming, so issue conversion does not wait on git log
+    issue_commits = get_issue_commits(milestone_title)
+
+    issue_count, issues = fetch_search_pages(graphql_query, search_query, issue_commits, stop_at_search_limit=True)
+    if issue_count >= SEARCH_RESULT_LIMIT:
+        print(f"there are {issue_count} issues matching search query, more than search result limit. sharding the search by created date")
+        issues = fetch_sharded_search_pages(graphql_query, search_query, issue_commits)
+
+    print(f"there are {issue_count} issues matching search query. and downloaded {len(issues)} issues.")
+    return issues
+
+
+@tracing.traced("fetch_search_pages")
+def fetch_search_pages(graphql_query: str, search_query: str, issue_commits: Dict[int, List[str]],
+                       stop_at_search_limit: bool = False) -> Tuple[int, List[IssueModel]]:
+    """
+        returns issue count and converted issues of all pages. issue nodes are converted while page response is streamed.
+        when stop_at_search_limit is true and issue count reaches search result limit, only first page is fetched
+    """
+    github_client = get_github_client()
+    issues: List[IssueModel] = []
+    cursor: Optional[str] = None
+    remaining_pages = 1
+    while True:
+        reserved_points = github_client.ensure_budget(remaining_pages, f"issues of search query [{search_query}]")
+        search_results = github_client.query_stream(graphql_query, {"searchQuery": search_query, "cursor": cursor},
+                                                    array_path=("search", "nodes"),
+                                                    on_item=lambda gql_issue: issues.append(get_converted_issue(gql_issue, issue_commits)),
+                                                    reserved_points=reserved_points)["search"]
+        if stop_at_search_limit and search_results["issueCount"] >= SEARCH_RESULT_LIMIT:
+            break
+        remaining_pages = get_page_count(min(search_results["issueCount"], SEARCH_RESULT_LIMIT) - len(issues), ISSUES_PAGE_SIZE)
+        if not search_results["pageInfo"]["hasNextPage"] or remaining_pages == 0:
+            break
+        cursor = search_results["pageInfo"]["endCursor"]
+
+    return search_results["issueCount"], issues
+
+
+def get_created_range_query_part(created_from: datetime, created_to: datetime):
+    return f"created:{created_from.strftime(SEARCH_DATE_FORMAT)}..{created_to.strftime(SEARCH_DATE_FORMAT)}"
+
+
+def fetch_sharded_search_pages(graphql_query: str, search_query: str, issue_commits: Dict[int, List[str]]):
+    """
+        splits the search by created date ranges. a range is halved while its issue count reaches search result limit.
+        ranges of a level are fetched concurrently, github client limits the concurrent requests and budget.
+        issues are merged in created range order and deduplicated by issue number
+    """
+    pending_ranges = [(SEARCH_START_TIME, datetime.now(timezone.utc).replace(microsecond=0))]
+    shard_issues: List[Tuple[datetime, List[IssueModel]]] = []
+    shard_concurrency = get_env_int_value("GITHUB_SEARCH_SHARD_CONCURRENCY", default_value=4)
+    with ThreadPoolExecutor(max_workers=shard_concurrency, thread_name_prefix="search-shard") as shard_executor:
+        while len(pending_ranges) > 0:
+            shard_futures = []
+            for created_from, created_to in pending_ranges:
+                is_splittable = created_to - created_from > timedelta(seconds=1)
+                shard_search_query = f"{search_query} {get_created_range_query_part(created_from, created_to)}"
+                shard_futures.append((created_from, created_to, is_splittable,
+                                      shard_executor.submit(fetch_search_pages, graphql_query, shard_search_query, issue_commits, is_splittable)))
+            pending_ranges = []
+            for created_from, created_to, is_splittable, shard_future in shard_futures:
+                shard_issue_count, issues = shard_future.result()
+                if is_splittable and shard_issue_count >= SEARCH_RESULT_LIMIT:
+                    created_middle = created_from + (created_to - created_from) // 2
+                    created_middle = created_middle.replace(microsecond=0)
+                    pending_ranges.append((created_from, created_middle))
+                    pending_ranges.append((created_middle + timedelta(seconds=1), created_to))
+                    continue
+                if shard_issue_count >= SEARCH_RESULT_LIMIT:
+                    print(f"created range [{get_created_range_query_part(created_from, created_to)}] can not be split further, "
+                          f"downloaded {len(issues)} of {shard_issue_count} issues")
+                shard_issues.append((created_from, issues))
 
-    github_token = get_env_value("GH_TOKEN")
-    headers = {
-        "Authorization": f"Bearer {github_token}",
-        "Content-Type": "application/json",
-    }
-    graphql_url = get_env_value("GITHUB_GRAPHQL_URL")
-    response = requests.post(graphql_url, headers=headers, json={"query": graphql_query})
-    print("graphql response: ", response)
-    response.raise_for_status()  # Raise an exception for HTTP errors
-
-    response_json = response.json()
-    # print("response json dict: ", response_json)
-    search_results = response_json["data"]["search"]
-    print(f"there are {search_results["issueCount"]} issues matching search query. and downloaded {len(search_results["nodes"])} issues.")
-    return search_results["nodes"]
+    shard_issues.sort(key=lambda shard: shard[0])
+    unique_issues: Dict[int, IssueModel] = {}
+    for _, issues in shard_issues:
+        for issue in issues:
+            unique_issues.setdefault(issue.number, issue)
+    print(f"sharded search is fetched in {len(shard_issues)} created date ranges")
+    tracing.add_span_attributes(shards=len(shard_issues))
+    return list(unique_issues.values())
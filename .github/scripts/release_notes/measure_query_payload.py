@@ -0,0 +1,122 @@
+from argparse import ArgumentParser
+import json
+from pathlib import Path
+import random
+import re
+from typing import Any, Dict, List, Optional
+from .graphql_query import Selection, build_issue_search_query, get_issue_selection
+from .issues import CATEGORY_ISSUE_FIELDS, ISSUES_PAGE_SIZE
+from ..utils import get_env_int_value
+
+
+FIXTURE_SEED = 20261019
+FIXTURE_LABELS = ["bug", "enhancement", "documentation", "maintenance", "dependencies", "help wanted", "good first issue"]
+FIXTURE_AUTHOR_ASSOCIATIONS = ["OWNER", "MEMBER", "COLLABORATOR", "CONTRIBUTOR", "NONE"]
+FIXTURE_WORDS = ["expense", "purchase", "refund", "income", "user", "signup", "login", "api", "lambda", "dynamodb", "table",
+                 "request", "response", "validation", "error", "deploy", "stack", "config", "ui", "page", "report", "date"]
+# selection of hand written issue query, before the selection was derived from IssueModel. commits came from timeline items
+BASELINE_ISSUE_SELECTION: Selection = {
+    "__typename": None,
+    "number": None,
+    "title": None,
+    "bodyText": None,
+    "comments(first: 3)": {"totalCount": None, "nodes": {"bodyText": None}},
+    "labels(first: 10)": {"nodes": {"name": None}},
+    "timelineItems(first: 20, itemTypes: [REFERENCED_EVENT])": {"totalCount": None, "edges": {"node": {"__typename": None, "commit": {"message": None}}}},
+}
+PAGINATION_ARGUMENT_REGEX = re.compile(r"\b(first|last):\s*(\d+)")
+
+
+def get_fixture_text(rand: random.Random, min_words: int, max_words: int):
+    return " ".join(rand.choice(FIXTURE_WORDS) for _ in range(rand.randint(min_words, max_words)))
+
+
+def get_fixture_issue_node(rand: random.Random, issue_number: int, comment_count: int) -> Dict[str, Any]:
+    """
+        issue node with every field of baseline and milestone issue selections, sized like issues of this repository
+    """
+    comment_nodes = [{"bodyText": get_fixture_text(rand, 5, 120),
+                      "authorAssociation": rand.choice(FIXTURE_AUTHOR_ASSOCIATIONS),
+                      "reactions": {"totalCount": rand.randint(0, 5)}}
+                     for _ in range(rand.randint(0, comment_count))]
+    referenced_commit_edges = [{"node": {"__typename": "ReferencedEvent", "commit": {"message": f"{get_fixture_text(rand, 3, 15)} #{issue_number}"}}}
+                               for _ in range(rand.randint(0, 4))]
+    return {"__typename": "Issue",
+            "number": issue_number,
+            "title": get_fixture_text(rand, 3, 12),
+            "bodyText": get_fixture_text(rand, 20, 400),
+            "updatedAt": f"2025-{rand.randint(1, 12):02d}-{rand.randint(1, 28):02d}T10:00:00Z",
+            "labels": {"nodes": [{"name": label} for label in rand.sample(FIXTURE_LABELS, rand.randint(1, 3))]},
+            "milestone": {"number": 7},
+            "comments": {"totalCount": len(comment_nodes) + rand.randint(0, 5), "nodes": comment_nodes},
+            "timelineItems": {"totalCount": len(referenced_commit_edges), "edges": referenced_commit_edges}}
+
+
+def get_fixture_nodes(issue_count: int, comment_count: int):
+    rand = random.Random(FIXTURE_SEED)
+    return [get_fixture_issue_node(rand, 100 + ind, comment_count) for ind in range(issue_count)]
+
+
+def get_selected_node(node: Dict[str, Any], selection: Selection) -> Dict[str, Any]:
+    """
+        part of response node that github returns for the selection. arguments like `(first: 20)` are not part of response key,
+        and `first` or `last` argument limits nodes or edges of connection
+    """
+    selected_node: Dict[str, Any] = {}
+    for field, sub_selection in selection.items():
+        response_key = field.split("(")[0].strip()
+        value = node.get(response_key)
+        pagination_match = PAGINATION_ARGUMENT_REGEX.search(field)
+        if pagination_match is not None and isinstance(value, dict):
+            item_limit = int(pagination_match.group(2))
+            value = {key: ((items[:item_limit] if pagination_match.group(1) == "first" else items[max(0, len(items) - item_limit):]) if isinstance(items, list) else items)
+                     for key, items in value.items()}
+        if sub_selection is None or value is None:
+            selected_node[response_key] = value
+        elif isinstance(value, list):
+            selected_node[response_key] = [get_selected_node(item, sub_selection) for item in value]
+        else:
+            selected_node[response_key] = get_selected_node(value, sub_selection)
+    return selected_node
+
+
+def get_page_bytes(nodes: List[Dict[str, Any]], selection: Selection):
+    page = {"data": {"search": {"issueCount": len(nodes),
+                                "pageInfo": {"hasNextPage": False, "endCursor": "Y3Vyc29yOjEwMA=="},
+                                "nodes": [get_selected_node(node, selection) for node in nodes]}}}
+    return len(json.dumps(page, separators=(",", ":")).encode("utf-8"))
+
+
+def measure_query_payload(fixture_path: Optional[Path] = None):
+    """
+        prints query size and serialized response size of one search page for issue selection of each use site,
+        and their change from baseline selection of hand written query. query size is of same compact query form for all selections.
+        fixture is a recorded search response with fields of all selections, otherwise a seeded page of generated issues
+    """
+    comment_count = get_env_int_value("GITHUB_ISSUE_COMMENT_CANDIDATES", default_value=10)
+    if fixture_path is not None:
+        nodes = json.loads(fixture_path.read_text(encoding="utf-8"))["data"]["search"]["nodes"]
+    else:
+        nodes = get_fixture_nodes(ISSUES_PAGE_SIZE, comment_count)
+
+    use_site_selections = {"baseline": BASELINE_ISSUE_SELECTION,
+                           "milestone": get_issue_selection(comment_count),
+                           "category": get_issue_selection(comment_count, CATEGORY_ISSUE_FIELDS)}
+    baseline_bytes = get_page_bytes(nodes, BASELINE_ISSUE_SELECTION)
+    print(f"page of {len(nodes)} issues, {comment_count} comments per issue")
+    for use_site, selection in use_site_selections.items():
+        query_bytes = len(build_issue_search_query(ISSUES_PAGE_SIZE, selection).encode("utf-8"))
+        page_bytes = get_page_bytes(nodes, selection)
+        print(f"{use_site:<10} query={query_bytes} bytes, page={page_bytes} bytes ({(page_bytes - baseline_bytes) / baseline_bytes:+.1%} of baseline)")
+
+
+if __name__ == "__main__":
+    """
+    example, from .github directory
+    python -m scripts.release_notes.measure_query_payload
+    python -m scripts.release_notes.measure_query_payload --fixture ../dist/search-page.json
+    """
+    parser = ArgumentParser(description="measures issue search payload of each use site selection against hand written query")
+    parser.add_argument("--fixture", help="recorded github search response json, default is seeded generated page")
+    args = parser.parse_args()
+    measure_query_payload(Path(args.fixture) if args.fixture else None)
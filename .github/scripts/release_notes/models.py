@@ -13,6 +13,18 @@ class IssueModel(BaseModel):
     body: str
     comments: CommentsModel
     commits: List[str]
+    updated_at: str = Field(default="")
+    labels: List[str] = Field(default_factory=list)
+    # title of category, the issue is summarized in. set only when issue is cross referenced from other category
+    primary_category: str = Field(default="")
+    # numbers of near duplicate issues merged into this issue
+    related_numbers: List[int] = Field(default_factory=list)
+    milestone_number: Optional[int] = Field(default=None)
+
+
+class MilestoneModel(BaseModel):
+    title: str
+    number: Optional[int] = Field(default=None)
 
 
 class LabelsModel(BaseModel):
@@ -0,0 +1,110 @@
+from functools import cache
+import json
+import re
+from typing import Dict, List
+from .models import IssueModel
+from ..utils import rootpath
+
+
+MERGE_COMMIT_PREFIXES = ("merge pull request", "merge branch", "merge remote-tracking branch")
+COMMIT_TRAILER_REGEX = re.compile(r"^(co-authored-by|signed-off-by|reviewed-by):", re.IGNORECASE)
+REPLY_HEADER_REGEX = re.compile(r"^on .+ wrote:$", re.IGNORECASE)
+EMPTY_PLACEHOLDERS = {"na", "n/a", "none", "-"}
+
+
+def normalize_line(line: str):
+    """
+        drops markdown markers and whitespace, so template line and rendered body text line are comparable
+    """
+    cleaned = re.sub(r"[#>*_`]", "", line)
+    return " ".join(cleaned.split()).strip(":").strip().lower()
+
+
+@cache
+def get_template_boilerplate_lines():
+    """
+        collects the lines of issue templates, excluding front matter
+    """
+    boilerplate_lines = set()
+    for template_path in sorted((rootpath/".github/ISSUE_TEMPLATE").glob("*.md")):
+        template_lines = template_path.read_text(encoding="utf-8").splitlines()
+        if len(template_lines) > 0 and template_lines[0].strip() == "---":
+            front_matter_end = next((ind for ind, line in enumerate(template_lines[1:], start=1) if line.strip() == "---"), 0)
+            template_lines = template_lines[front_matter_end + 1:]
+        for line in template_lines:
+            normalized = normalize_line(line)
+            if len(normalized) > 0:
+                boilerplate_lines.add(normalized)
+    return frozenset(boilerplate_lines)
+
+
+def get_compact_text(text: str, strip_boilerplate: bool = False):
+    """
+        drops quoted reply blocks, template boilerplate lines and collapses whitespace
+    """
+    boilerplate_lines = get_template_boilerplate_lines() if strip_boilerplate else frozenset()
+    kept_lines: List[str] = []
+    for line in text.splitlines():
+        stripped = line.strip()
+        if stripped.startswith(">") or REPLY_HEADER_REGEX.match(stripped):
+            continue
+        normalized = normalize_line(stripped)
+        if len(normalized) == 0 or normalized in EMPTY_PLACEHOLDERS or normalized in boilerplate_lines:
+            continue
+        kept_lines.append(" ".join(stripped.split()))
+    return " ".join(kept_lines)
+
+
+def get_compact_commits(commits: List[str]):
+    """
+        removes merge commits, trailers and duplicate commit messages
+    """
+    compact_commits: List[str] = []
+    seen_commits = set()
+    for commit in commits:
+        if commit.strip().lower().startswith(MERGE_COMMIT_PREFIXES):
+            continue
+        message_lines = [line for line in commit.splitlines() if not COMMIT_TRAILER_REGEX.match(line.strip())]
+        compact_commit = get_compact_text("\n".join(message_lines))
+        commit_key = compact_commit.lower()
+        if len(compact_commit) == 0 or commit_key in seen_commits:
+            continue
+        seen_commits.add(commit_key)
+        compact_commits.append(compact_commit)
+    return compact_commits
+
+
+def get_compacted_issue(issue: IssueModel):
+    comments = [get_compact_text(cmt) for cmt in issue.comments.top_prioritized]
+    return issue.model_copy(update={
+        "title": " ".join(issue.title.split()),
+        "body": get_compact_text(issue.body, strip_boilerplate=True),
+        "comments": issue.comments.model_copy(update={
+            "top_prioritized": [cmt for cmt in comments if len(cmt) > 0]
+        }),
+        "commits": get_compact_commits(issue.commits)
+    })
+
+
+def get_prompt_issue_dict(issue: IssueModel):
+    """
+        short keys of prompt issue json. empty fields are omitted
+        n: number, t: title, b: body, c: comments, m: commit messages, x: primary category of cross referenced issue,
+        r: numbers of merged near duplicate issues
+    """
+    prompt_issue: Dict = {"n": issue.number, "t": issue.title}
+    if len(issue.body) > 0:
+        prompt_issue["b"] = issue.body
+    if len(issue.comments.top_prioritized) > 0:
+        prompt_issue["c"] = issue.comments.top_prioritized
+    if len(issue.commits) > 0:
+        prompt_issue["m"] = issue.commits
+    if len(issue.primary_category) > 0:
+        prompt_issue["x"] = issue.primary_category
+    if len(issue.related_numbers) > 0:
+        prompt_issue["r"] = issue.related_numbers
+    return prompt_issue
+
+
+def dump_prompt_issues(issues: List[IssueModel]):
+    return json.dumps([get_prompt_issue_dict(issue) for issue in issues], ensure_ascii=False, separators=(",", ":"))
@@ -1,65 +1,377 @@
+from concurrent.futures import Executor
+from enum import Enum
+from functools import cache
+import hashlib
 from pathlib import Path
 from string import Template
-from typing import List
+from typing import Callable, List, Optional, Tuple
 from pydantic import TypeAdapter
+from .checkpoint import CategoryCheckpoint
 from .models import IssueModel
-from ..genai import llm
+from . import prompt_serializer
+from .issue_clustering import cluster_issues
+from ..genai import llm, tokens
+from ..genai.model_routing import ModelRoute
+from ..utils import get_converted_enum, get_env_bool_value, get_env_int_value, get_optional_env_value, get_preview, tracing
 
 
-def summarize_category(category_title: str, category_labels: List[str], change_template: str, issues: List[IssueModel]):
-    summarized_responses: List[str] = []
-    if len(issues) > 0:
-        chunk_size = 40
-        for i in range(0, len(issues), chunk_size):
-            chunk_issues = issues[i:i+chunk_size]
-            prompt = get_category_summarizer_prompt(category_title=category_title,
-                                                    category_labels=category_labels,
-                                                    change_template=change_template,
-                                                    issues=chunk_issues)
+issue_list_adapter = TypeAdapter(List[IssueModel])
 
-            response = llm.generate_content(prompt)
-            summarized_responses.append(response)
 
-    return "\n".join(summarized_responses)
+class SummarizeMode(Enum):
+    Concat = "concat"
+    MapReduce = "map-reduce"
 
 
-def get_category_summarizer_prompt(category_title: str, category_labels: List[str], change_template: str, issues: List[IssueModel]):
-    # read file
-    prompt_file_path = Path(__file__).resolve().parent/"issue-category-summarize.prompt.txt"
+def get_summarize_mode():
+    mode_value = get_optional_env_value("RELEASE_SUMMARIZE_MODE", SummarizeMode.MapReduce.value)
+    summarize_mode = get_converted_enum(SummarizeMode, mode_value)
+    if summarize_mode is None:
+        raise ValueError(f"RELEASE_SUMMARIZE_MODE env [{mode_value}] is not supported")
+    return summarize_mode
+
+
+def generate_all(prompts: List[str], executor: Optional[Executor] = None, prompt_prefix: Optional[str] = None,
+                 model_route: ModelRoute = ModelRoute.Large, checkpoint: Optional[CategoryCheckpoint] = None):
+    """
+        generates contents of prompts in parallel when executor is provided. responses are in prompt order.
+        responses stored in checkpoint are reused, and new responses are recorded in it
+    """
+    def generate(prompt: str):
+        stored_text = checkpoint.get_response(prompt) if checkpoint is not None else None
+        if stored_text is not None:
+            return stored_text
+        response_text = llm.generate_content(prompt, get_summarizer_generation_config(), prompt_prefix=prompt_prefix, model_route=model_route)
+        if checkpoint is not None:
+            checkpoint.set_response(prompt, response_text)
+        return response_text
+
+    if executor is None:
+        return [generate(prompt) for prompt in prompts]
+    prompt_futures = [executor.submit(generate, prompt) for prompt in prompts]
+    return [prompt_future.result() for prompt_future in prompt_futures]
+
+
+def stream_final_summary(prompt: str, on_fragment: Callable[[str], None], executor: Optional[Executor] = None, prompt_prefix: Optional[str] = None,
+                         model_route: ModelRoute = ModelRoute.Large, checkpoint: Optional[CategoryCheckpoint] = None):
+    """
+        streams the final llm call of category. unique changelog lines are handed over as they complete.
+        the stream is consumed by llm executor, so llm concurrency limit applies.
+        response stored in checkpoint is handed over as single fragment
+    """
+    def consume_stream():
+        line_filter = ChangelogLineFilter(on_fragment)
+        stored_text = checkpoint.get_response(prompt) if checkpoint is not None else None
+        fragments = [stored_text] if stored_text is not None else \
+            llm.generate_content_stream(prompt, get_summarizer_generation_config(), prompt_prefix=prompt_prefix, model_route=model_route)
+        for fragment in fragments:
+            line_filter.feed(fragment)
+        line_filter.close()
+        if checkpoint is not None and stored_text is None:
+            checkpoint.set_response(prompt, line_filter.get_text())
+        return line_filter.get_text()
+
+    if executor is None:
+        return consume_stream()
+    return executor.submit(consume_stream).result()
+
+
+def summarize_category(category_title: str, category_labels: List[str], change_template: str, issues: List[IssueModel],
+                       executor: Optional[Executor] = None, on_fragment: Optional[Callable[[str], None]] = None,
+                       checkpoint: Optional[CategoryCheckpoint] = None):
+    """
+        summarizes the category issues chunk by chunk.
+        when executor is provided, chunks are summarized in parallel.
+        in map-reduce mode, chunk summaries are merged in a tree of reduce calls, otherwise joined in chunk order.
+        when on_fragment is provided, the final llm call is streamed to it. the streamed text is same as returned text.
+        when checkpoint is provided, chunk and reduce responses of interrupted run are reused.
+    """
+    summarize_mode = get_summarize_mode()
+    prompts = get_category_prompts(category_title=category_title,
+                                   category_labels=category_labels,
+                                   change_template=change_template,
+                                   issues=issues)
+    # instructions are same for all chunks of run. they are sent from context cache only when they reach LLM_CONTEXT_CACHE_MIN_TOKENS,
+    # default instructions are smaller, so full prompts are sent unless template adds enough stable text
+    prompt_prefix = get_category_summarizer_prompt_prefix(change_template)
+    # chunk prompts are routed by size, reduce prompts always go to large model
+    if on_fragment is not None and len(prompts) == 1:
+        return stream_final_summary(prompts[0], on_fragment, executor, prompt_prefix, ModelRoute.BySize, checkpoint)
+
+    chunk_responses = generate_all(prompts, executor, prompt_prefix, ModelRoute.BySize, checkpoint)
+    if summarize_mode == SummarizeMode.MapReduce:
+        return reduce_summaries(category_title=category_title,
+                                change_template=change_template,
+                                summaries=chunk_responses,
+                                executor=executor,
+                                on_fragment=on_fragment,
+                                checkpoint=checkpoint)
+
+    category_summary = dedupe_bullets("\n".join(chunk_responses))
+    if on_fragment is not None and len(category_summary) > 0:
+        on_fragment(category_summary)
+    return category_summary
+
+
+def reduce_summaries(category_title: str, change_template: str, summaries: List[str],
+                     executor: Optional[Executor] = None, on_fragment: Optional[Callable[[str], None]] = None,
+                     checkpoint: Optional[CategoryCheckpoint] = None):
+    """
+        merges partial summaries level by level, until joined partial summaries fit output token budget of RELEASE_REDUCE_OUTPUT_TOKEN_BUDGET env.
+        each reduce call merges up to fan-in summaries, so the number of sequential llm calls grows with log(chunks).
+        returns the deduped final summary
+    """
+    fan_in = get_env_int_value("RELEASE_REDUCE_FANIN", default_value=4, min_value=2)
+    output_token_budget = get_env_int_value("RELEASE_REDUCE_OUTPUT_TOKEN_BUDGET", default_value=2000)
+    partial_summaries = [summary for summary in summaries if len(summary.strip()) > 0]
+    reduce_level = 0
+    while len(partial_summaries) > 1 and tokens.estimate_tokens("\n".join(partial_summaries)) > output_token_budget:
+        reduce_level += 1
+        summary_groups = [partial_summaries[i:i+fan_in] for i in range(0, len(partial_summaries), fan_in)]
+        print(f"category [{category_title}] reduce level {reduce_level}: merging {len(partial_summaries)} partial summaries into {len(summary_groups)}")
+        reduce_prompts = [get_category_reducer_prompt(category_title=category_title,
+                                                      change_template=change_template,
+                                                      summaries=summary_group)
+                          for summary_group in summary_groups]
+        if on_fragment is not None and len(reduce_prompts) == 1:
+            return stream_final_summary(reduce_prompts[0], on_fragment, executor, checkpoint=checkpoint)
+        partial_summaries = generate_all(reduce_prompts, executor, checkpoint=checkpoint)
+
+    final_summary = dedupe_bullets("\n".join(partial_summaries))
+    if on_fragment is not None and len(final_summary) > 0:
+        on_fragment(final_summary)
+    return final_summary
+
+
+class ChangelogLineFilter:
+    """
+        filters the changelog text as fragments arrive, and hands over unique lines as they complete.
+        lines are compared case and whitespace insensitive. leading and trailing blank lines are dropped
+    """
+
+    def __init__(self, on_fragment: Optional[Callable[[str], None]] = None):
+        self.on_fragment = on_fragment
+        self.pending_text = ""
+        self.seen_lines = set()
+        self.blank_line_count = 0
+        self.emitted_fragments: List[str] = []
+
+    def feed(self, fragment: str):
+        self.pending_text += fragment
+        *completed_lines, self.pending_text = self.pending_text.split("\n")
+        for line in completed_lines:
+            self.add_line(line)
+
+    def add_line(self, line: str):
+        line_key = " ".join(line.split()).lower()
+        if len(line_key) == 0:
+            if len(self.emitted_fragments) > 0:
+                self.blank_line_count += 1
+            return
+        if line_key in self.seen_lines:
+            return
+        self.seen_lines.add(line_key)
+        line_fragment = line.rstrip()
+        if len(self.emitted_fragments) > 0:
+            line_fragment = "\n" * (self.blank_line_count + 1) + line_fragment
+        self.blank_line_count = 0
+        self.emitted_fragments.append(line_fragment)
+        if self.on_fragment is not None:
+            self.on_fragment(line_fragment)
+
+    def close(self):
+        self.add_line(self.pending_text)
+        self.pending_text = ""
+
+    def get_text(self):
+        return "".join(self.emitted_fragments)
+
+
+def dedupe_bullets(summary: str):
+    """
+        removes repeated changelog lines, compared case and whitespace insensitive
+    """
+    line_filter = ChangelogLineFilter()
+    line_filter.feed(summary)
+    line_filter.close()
+    return line_filter.get_text()
+
+
+def get_truncated_issue(issue: IssueModel, body_max_tokens: int, comment_max_tokens: int, commit_max_tokens: int):
+    """
+        truncates oversized body, comments and commit messages deterministically
+    """
+    return issue.model_copy(update={
+        "body": tokens.truncate_to_tokens(issue.body, body_max_tokens),
+        "comments": issue.comments.model_copy(update={
+            "top_prioritized": [tokens.truncate_to_tokens(cmt, comment_max_tokens) for cmt in issue.comments.top_prioritized]
+        }),
+        "commits": [tokens.truncate_to_tokens(cmt, commit_max_tokens) for cmt in issue.commits]
+    })
+
+
+def get_summarizer_generation_config():
+    """
+        greedy decoding keeps the changelog stable across reruns, so responses are cacheable
+    """
+    return llm.get_generation_config(temperature=0)
+
+
+def calibrate_issue_token_estimator(category_issues: List[List[IssueModel]]):
+    """
+        LLM_TOKEN_CALIBRATION=true calibrates token estimator once per process with prompt json of first issues of milestone.
+        it is called before categories are chunked, so chunk boundaries dont depend on timing of category workers
+    """
+    if not get_env_bool_value("LLM_TOKEN_CALIBRATION"):
+        return
+    _, sample_jsons = get_prompt_issue_jsons([issue for issues in category_issues for issue in issues][:10])
+    if len(sample_jsons) > 0:
+        tokens.calibrate_token_estimator("\n".join(sample_jsons))
+
+
+def get_prompt_issue_jsons(issues: List[IssueModel]) -> Tuple[List[IssueModel], List[str]]:
+    """
+        truncated issues and prompt json of each issue
+    """
+    body_max_tokens = get_env_int_value("RELEASE_ISSUE_BODY_MAX_TOKENS", default_value=1000)
+    comment_max_tokens = get_env_int_value("RELEASE_ISSUE_COMMENT_MAX_TOKENS", default_value=300)
+    commit_max_tokens = get_env_int_value("RELEASE_ISSUE_COMMIT_MAX_TOKENS", default_value=100)
+    truncated_issues = [get_truncated_issue(prompt_serializer.get_compacted_issue(issue), body_max_tokens, comment_max_tokens, commit_max_tokens)
+                        for issue in issues]
+    return truncated_issues, [prompt_serializer.dump_prompt_issues([issue]) for issue in truncated_issues]
+
+
+def get_issue_chunks(issues: List[IssueModel]):
+    """
+        packs issues into chunks by estimated tokens, so llm calls are proportional to content volume.
+        an issue larger than budget gets its own chunk.
+    """
+    token_budget = get_env_int_value("RELEASE_CHUNK_TOKEN_BUDGET", default_value=12000)
+    truncated_issues, issue_jsons = get_prompt_issue_jsons(issues)
+
+    chunks: List[List[IssueModel]] = []
+    chunk_tokens: List[int] = []
+    current_chunk: List[IssueModel] = []
+    current_tokens = 0
+    for issue, issue_json in zip(truncated_issues, issue_jsons):
+        issue_tokens = tokens.estimate_tokens(issue_json)
+        if len(current_chunk) > 0 and current_tokens + issue_tokens > token_budget:
+            chunks.append(current_chunk)
+            chunk_tokens.append(current_tokens)
+            current_chunk = []
+            current_tokens = 0
+        current_chunk.append(issue)
+        current_tokens += issue_tokens
+
+    if len(current_chunk) > 0:
+        chunks.append(current_chunk)
+        chunk_tokens.append(current_tokens)
+
+    print(f"packed {len(issues)} issues into {len(chunks)} chunks with token budget [{token_budget}]. estimated tokens per chunk: {chunk_tokens}")
+    return chunks
+
+
+def print_serialization_savings(category_title: str, issues: List[IssueModel], chunks: List[List[IssueModel]]):
+    full_json = issue_list_adapter.dump_json(issues).decode()
+    compact_jsons = [prompt_serializer.dump_prompt_issues(chunk_issues) for chunk_issues in chunks]
+    full_bytes = len(full_json.encode("utf-8"))
+    compact_bytes = sum(len(compact_json.encode("utf-8")) for compact_json in compact_jsons)
+    saved_tokens = tokens.estimate_tokens(full_json) - sum(tokens.estimate_tokens(compact_json) for compact_json in compact_jsons)
+    saved_ratio = (full_bytes - compact_bytes) / full_bytes if full_bytes > 0 else 0
+    print(f"category [{category_title}] compact issues json is {compact_bytes} bytes instead of {full_bytes} bytes. "
+          f"saved {full_bytes - compact_bytes} bytes ({saved_ratio:.0%}), about {saved_tokens} estimated tokens")
+
+
+def get_category_prompts(category_title: str, category_labels: List[str], change_template: str, issues: List[IssueModel]):
+    prompts: List[str] = []
+    issues = cluster_issues(category_title, issues)
+    chunks = get_issue_chunks(issues)
+    print_serialization_savings(category_title, issues, chunks)
+    for chunk_issues in chunks:
+        prompt = get_category_summarizer_prompt(category_title=category_title,
+                                                category_labels=category_labels,
+                                                change_template=change_template,
+                                                issues=chunk_issues)
+        prompts.append(prompt)
+    return prompts
+
+
+@cache
+def get_prompt_template(prompt_file_name: str, required_identifiers: Tuple[str, ...]):
+    """
+        reads and validates the prompt template once per process
+    """
+    prompt_file_path = Path(__file__).resolve().parent/prompt_file_name
     with open(prompt_file_path, mode="r", encoding="utf-8") as f:
-        prompt = f.read()
-        prompt_template = Template(prompt)
-        prompt_identifiers = prompt_template.get_identifiers()
-        required_identifiers = ["category_title", "category_labels", "change_template", "issues_json"]
-        missing_identifiers = set(required_identifiers) - set(prompt_identifiers)
-        if len(missing_identifiers) > 0:
-            raise ValueError(f"prompt doesnt required identifiers. missing identifiers: {missing_identifiers}")
-
-        missing_identifiers = set(prompt_identifiers) - set(required_identifiers)
-        if len(missing_identifiers) > 0:
-            raise ValueError(f"prompt has more identifiers than required identifiers. additional identifiers: {missing_identifiers}")
-
-        json_category_labels = str(category_labels)
-
-        issue_list_adapter = TypeAdapter(List[IssueModel])
-        json_issues = issue_list_adapter.dump_json(issues).decode()
-        print("json issues=", len(json_issues))
-        print(json_issues)
-        print("-" * 80)
-        # iss_model_list = [iss.model_dump() for iss in issues]
-        # print("list of issue model dict =", len(iss_model_list))
-        # print(iss_model_list)
-        # print("-" * 80)
-        # iss_model_list_json = json.dumps(iss_model_list)
-        # print("model dump issues=", len(iss_model_list_json))
-        # print(iss_model_list_json)
-        # print("-" * 80)
-
-        substituted_prompt = prompt_template.substitute(category_title=category_title,
-                                                        category_labels=json_category_labels,
-                                                        change_template=change_template,
-                                                        issues_json=json_issues)
-        print("prompt: ", substituted_prompt, "\n")
-        return substituted_prompt
-
-    raise ValueError("unable to prepare prompt")
+        prompt_template = Template(f.read())
+
+    prompt_identifiers = prompt_template.get_identifiers()
+    missing_identifiers = set(required_identifiers) - set(prompt_identifiers)
+    if len(missing_identifiers) > 0:
+        raise ValueError(f"prompt doesnt required identifiers. missing identifiers: {missing_identifiers}")
+
+    missing_identifiers = set(prompt_identifiers) - set(required_identifiers)
+    if len(missing_identifiers) > 0:
+        raise ValueError(f"prompt has more identifiers than required identifiers. additional identifiers: {missing_identifiers}")
+
+    return prompt_template
+
+
+def write_prompt_debug_artifact(category_title: str, prompt: str):
+    """
+        full prompt is written to debug dir only on request by RELEASE_PROMPT_DEBUG_DIR env
+    """
+    debug_dir = get_optional_env_value("RELEASE_PROMPT_DEBUG_DIR")
+    if debug_dir is None:
+        return
+    prompt_hash = hashlib.sha256(prompt.encode("utf-8")).hexdigest()[:12]
+    safe_category_title = "-".join(category_title.lower().split())
+    prompt_debug_path = Path(debug_dir)/f"{safe_category_title}-{prompt_hash}.prompt.txt"
+    prompt_debug_path.parent.mkdir(parents=True, exist_ok=True)
+    prompt_debug_path.write_text(prompt, encoding="utf-8")
+    print("full prompt is written to ", prompt_debug_path)
+
+
+def get_category_summarizer_prompt_prefix(change_template: str):
+    """
+        stable instructions part of summarizer prompt. it doesnt depend on category or issues
+    """
+    prefix_template = get_prompt_template("issue-category-summarize-prefix.prompt.txt", ("change_template",))
+    return prefix_template.substitute(change_template=change_template)
+
+
+@tracing.traced("get_category_summarizer_prompt")
+def get_category_summarizer_prompt(category_title: str, category_labels: List[str], change_template: str, issues: List[IssueModel]):
+    """
+        prompt is stable prefix followed by category and issues suffix
+    """
+    prompt_template = get_prompt_template("issue-category-summarize.prompt.txt",
+                                          ("category_title", "category_labels", "issues_json"))
+    json_category_labels = str(category_labels)
+    json_issues = prompt_serializer.dump_prompt_issues(issues)
+    preview_chars = get_env_int_value("RELEASE_LOG_PREVIEW_CHARS", default_value=300)
+    print("json issues=", len(json_issues))
+    print(get_preview(json_issues, preview_chars))
+    print("-" * 80)
+
+    substituted_prompt = get_category_summarizer_prompt_prefix(change_template) + \
+        prompt_template.substitute(category_title=category_title,
+                                   category_labels=json_category_labels,
+                                   issues_json=json_issues)
+    print("prompt: ", get_preview(substituted_prompt, preview_chars), "\n")
+    write_prompt_debug_artifact(category_title, substituted_prompt)
+    tracing.add_span_attributes(category=category_title, issues=len(issues), bytes=len(substituted_prompt.encode("utf-8")))
+    return substituted_prompt
+
+
+def get_category_reducer_prompt(category_title: str, change_template: str, summaries: List[str]):
+    prompt_template = get_prompt_template("issue-category-reduce.prompt.txt",
+                                          ("category_title", "change_template", "partial_summaries"))
+    partial_summaries = "\n\n".join(f"#### Partial Summary {ind}:\n{summary}" for ind, summary in enumerate(summaries, start=1))
+    substituted_prompt = prompt_template.substitute(category_title=category_title,
+                                                    change_template=change_template,
+                                                    partial_summaries=partial_summaries)
+    preview_chars = get_env_int_value("RELEASE_LOG_PREVIEW_CHARS", default_value=300)
+    print("reduce prompt: ", get_preview(substituted_prompt, preview_chars), "\n")
+    write_prompt_debug_artifact(category_title, substituted_prompt)
+    return substituted_prompt
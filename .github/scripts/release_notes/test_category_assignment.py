@@ -0,0 +1,45 @@
+import unittest
+from typing import List
+from .category_assignment import assign_issues_to_categories
+from .models import CommentsModel, IssueModel, ReleaseTemplateModel
+
+
+def get_template_model():
+    return ReleaseTemplateModel.model_validate({
+        "name-template": "$MILESTONE_TITLE",
+        "tag-template": "$MILESTONE_TITLE",
+        "categories": [{"title": "Bug Fixes", "labels": {"include": ["bug", "Fix"], "exclude": ["Deployment"]}},
+                       {"title": "Enhancements", "labels": {"include": ["enhancement"]}}],
+        "category-labels": {"exclude": ["Wont Fix"]},
+        "category-template": "$CATEGORY_ITEM_CHANGES",
+        "category-item-change-template": "- $TITLE",
+        "template": "$CATEGORY_CHANGES",
+    })
+
+
+def get_issue(number: int, labels: List[str]):
+    return IssueModel(number=number, title=f"issue {number}", body="", comments=CommentsModel(total=0, top_prioritized=[]),
+                      commits=[], labels=labels)
+
+
+def get_assigned_numbers(issues: List[IssueModel]):
+    return [[issue.number for issue in category_issues] for category_issues in assign_issues_to_categories(get_template_model(), issues)]
+
+
+class CategoryAssignmentTest(unittest.TestCase):
+
+    def test_mixed_case_labels_match(self):
+        issues = [get_issue(1, ["Bug"]), get_issue(2, ["fix"]), get_issue(3, ["ENHANCEMENT"])]
+        self.assertEqual(get_assigned_numbers(issues), [[1, 2], [3]])
+
+    def test_exclude_wins_over_include(self):
+        issues = [get_issue(1, ["bug", "deployment"]), get_issue(2, ["BUG", "Enhancement", "wont fix"]), get_issue(3, ["bug", "enhancement"])]
+        self.assertEqual(get_assigned_numbers(issues), [[3], []])
+
+    def test_unmatched_issue_is_not_assigned(self):
+        issues = [get_issue(1, ["question"]), get_issue(2, [])]
+        self.assertEqual(get_assigned_numbers(issues), [[], []])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,38 @@
+import os
+import unittest
+from unittest import mock
+from .context_selection import CommentCandidateModel, get_byte_size, select_issue_context
+from ..genai.tokens import TRUNCATION_MARKER
+
+
+def get_candidate(text: str, position: int, author_association: str = "NONE", reactions: int = 0):
+    return CommentCandidateModel(text=text, author_association=author_association, reactions=reactions, position=position)
+
+
+@mock.patch.dict(os.environ, {"RELEASE_ISSUE_CONTEXT_BYTES": "600"})
+class SelectIssueContextTest(unittest.TestCase):
+
+    def test_oversized_top_comment_is_truncated(self):
+        fix_explanation = "the crash is fixed by validating the expense date before saving " * 30
+        candidates = [get_candidate("short question about the release date", 0),
+                      get_candidate(fix_explanation, 1, author_association="OWNER", reactions=5),
+                      get_candidate("another small note about this issue", 2)]
+        selected_comments, _ = select_issue_context(candidates, [])
+        self.assertTrue(any(comment.endswith(TRUNCATION_MARKER) and comment.startswith("the crash is fixed") for comment in selected_comments))
+        self.assertLessEqual(sum(get_byte_size(comment) for comment in selected_comments), 600)
+
+    def test_truncation_keeps_utf8_chars_whole(self):
+        candidates = [get_candidate("é€😀 " * 400, 0, author_association="MEMBER")]
+        selected_comments, _ = select_issue_context(candidates, [])
+        self.assertEqual(len(selected_comments), 1)
+        self.assertLessEqual(get_byte_size(selected_comments[0]), 600)
+        self.assertNotIn("�", selected_comments[0])
+
+    def test_fitting_comments_are_kept_in_order_and_noise_is_dropped(self):
+        candidates = [get_candidate("first detailed comment", 0), get_candidate("+1", 1), get_candidate("last detailed comment", 2)]
+        selected_comments, _ = select_issue_context(candidates, [])
+        self.assertEqual(selected_comments, ["first detailed comment", "last detailed comment"])
+
+
+if __name__ == "__main__":
+    unittest.main()
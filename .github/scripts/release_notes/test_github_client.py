@@ -0,0 +1,51 @@
+from datetime import datetime, timedelta, timezone
+import unittest
+from .github_client import GithubGraphqlClient, RateLimitModel
+
+
+def get_reset_at(seconds: int):
+    return (datetime.now(timezone.utc) + timedelta(seconds=seconds)).strftime("%Y-%m-%dT%H:%M:%SZ")
+
+
+def get_client(remaining: int, cost_per_page: int):
+    client = GithubGraphqlClient(graphql_url="http://localhost/graphql", github_token="token", max_concurrency=2,
+                                 reserve_points=10, max_wait_seconds=0)
+    client.rate_limit = RateLimitModel(cost=cost_per_page, remaining=remaining, resetAt=get_reset_at(3600), limit=5000)
+    client.cost_per_page = cost_per_page
+    return client
+
+
+def get_response_json(rate_limit: RateLimitModel):
+    return {"data": {"rateLimit": rate_limit.model_dump(), "search": {"nodes": []}}}
+
+
+class GithubBudgetTest(unittest.TestCase):
+
+    def test_concurrent_workers_can_not_spend_same_points(self):
+        client = get_client(remaining=30, cost_per_page=10)
+        self.assertEqual(client.ensure_budget(1, "shard 1"), 10)
+        self.assertEqual(client.ensure_budget(1, "shard 2"), 10)
+        with self.assertRaisesRegex(ValueError, "20 points reserved by in flight requests"):
+            client.ensure_budget(1, "shard 3")
+
+    def test_reservation_is_released_with_response_rate_limit(self):
+        client = get_client(remaining=30, cost_per_page=10)
+        reset_at = client.rate_limit.resetAt
+        first_reserved, second_reserved = client.ensure_budget(1, "shard 1"), client.ensure_budget(1, "shard 2")
+        client.get_response_data(get_response_json(RateLimitModel(cost=10, remaining=10, resetAt=reset_at, limit=5000)), second_reserved)
+        # older response of same budget window does not raise remaining points back
+        client.get_response_data(get_response_json(RateLimitModel(cost=10, remaining=20, resetAt=reset_at, limit=5000)), first_reserved)
+        self.assertEqual((client.reserved_points, client.rate_limit.remaining), (0, 10))
+        with self.assertRaises(ValueError):
+            client.ensure_budget(1, "shard 3")
+
+    def test_failed_response_releases_reservation(self):
+        client = get_client(remaining=100, cost_per_page=10)
+        reserved_points = client.ensure_budget(2, "milestone")
+        with self.assertRaisesRegex(ValueError, "graphql query failed"):
+            client.get_response_data({"errors": [{"message": "bad query"}], "data": None}, reserved_points)
+        self.assertEqual((client.reserved_points, client.rate_limit.remaining), (0, 100))
+
+
+if __name__ == "__main__":
+    unittest.main()
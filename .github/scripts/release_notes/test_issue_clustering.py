@@ -0,0 +1,50 @@
+import os
+import unittest
+from unittest import mock
+from typing import List
+from .issue_clustering import cluster_issues
+from .models import CommentsModel, IssueModel
+
+
+DELETE_EXPENSE_BODY = "app closes after tapping delete on expense list"
+
+
+def get_issue(number: int, title: str, body: str):
+    return IssueModel(number=number, title=title, body=body, comments=CommentsModel(total=0, top_prioritized=[]), commits=[])
+
+
+def get_clusters(issues: List[IssueModel]):
+    return [[issue.number] + issue.related_numbers for issue in cluster_issues("Bug Fixes", issues)]
+
+
+@mock.patch.dict(os.environ, {"RELEASE_CLUSTER_ISSUES": "true"})
+class ClusterIssuesTest(unittest.TestCase):
+
+    def test_same_report_is_merged(self):
+        issues = [get_issue(1, "Crash when deleting expense", DELETE_EXPENSE_BODY),
+                  get_issue(2, "crash when deleting expense", "App closes after tapping delete on  expense list"),
+                  get_issue(3, "signup fails with invalid email", "error is shown for a valid email address")]
+        self.assertEqual(get_clusters(issues), [[1, 2], [3]])
+
+    def test_issues_differing_by_a_word_stay_separate(self):
+        issues = [get_issue(1, "crash when deleting expense", DELETE_EXPENSE_BODY),
+                  get_issue(2, "crash when deleting income", "app closes after tapping delete on income list"),
+                  get_issue(3, "signup fails with invalid email", ""),
+                  get_issue(4, "signup fails with valid email", "")]
+        self.assertEqual(get_clusters(issues), [[1], [2], [3], [4]])
+
+    def test_reworded_report_stays_separate(self):
+        issues = [get_issue(1, "crash when deleting expense", DELETE_EXPENSE_BODY),
+                  get_issue(2, "crash when deleting expense.", "app closes after tapping delete on the expense list")]
+        self.assertEqual(get_clusters(issues), [[1], [2]])
+
+    def test_clustering_is_opt_in(self):
+        issues = [get_issue(1, "crash when deleting expense", DELETE_EXPENSE_BODY),
+                  get_issue(2, "crash when deleting expense", DELETE_EXPENSE_BODY)]
+        with mock.patch.dict(os.environ):
+            os.environ.pop("RELEASE_CLUSTER_ISSUES")
+            self.assertEqual(get_clusters(issues), [[1], [2]])
+
+
+if __name__ == "__main__":
+    unittest.main()
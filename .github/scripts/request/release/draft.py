@@ -1,20 +1,68 @@
 from argparse import ArgumentError, ArgumentParser
+from concurrent.futures import Executor, ThreadPoolExecutor
+from functools import partial
+from pathlib import Path
 from string import Template
+from threading import Lock
+import time
 import traceback
-from typing import Callable, Dict, List
+from typing import Callable, Dict, List, Optional, Tuple
 from pydantic import TypeAdapter
 import os
-from ...utils import export_to_env, get_parsed_arg_value, get_yaml_to_dict, rootpath
-from ...release_notes import CategoryModel, LabelsModel, ReleaseTemplateModel, get_issues, summarize_category, IssueModel
+from ...utils import export_to_env, get_env_bool_value, get_env_int_value, get_optional_env_value, get_parsed_arg_value, get_safe_name, get_yaml_to_dict, \
+    rootpath, tracing
+from ...release_notes import CategoryManifest, CategoryModel, LabelsModel, ReleaseTemplateModel, assign_issues_to_categories, create_category_manifest, \
+    get_batch_category_summaries, get_category_fingerprint, get_github_client, get_issues, get_milestone_issues, prepare_category_batch, summarize_category, \
+    IssueModel, MilestoneModel, RunCheckpoint, calibrate_issue_token_estimator, create_run_checkpoint, get_summarizer_hash
 from ...genai import llm
 
 
-def get_summarized_category_changes(template_model: ReleaseTemplateModel, category: CategoryModel):
-    issues = get_issues(category, template_model.category_labels.exclude if template_model.category_labels is not None else [])
+def get_summarized_category_changes(template_model: ReleaseTemplateModel, category: CategoryModel, issues: List[IssueModel],
+                                    llm_executor: Optional[Executor] = None, on_fragment: Optional[Callable[[str], None]] = None,
+                                    category_manifest: Optional[CategoryManifest] = None, batch_summaries: Optional[Dict[str, str]] = None,
+                                    run_checkpoint: Optional[RunCheckpoint] = None):
+    """
+        summary of unchanged category is reused from manifest, and summary of batch mode is taken from batch responses, without llm calls.
+        summary completed by interrupted run is resumed from checkpoint, and partially summarized category reuses its stored responses
+    """
+    category_labels = category.labels.include if category.labels.include is not None else []
+    fingerprint = ""
+    if category_manifest is not None or run_checkpoint is not None:
+        fingerprint = get_category_fingerprint(category_title=category.safe_title,
+                                               category_labels=category_labels,
+                                               change_template=template_model.category_item_change_template,
+                                               issues=issues)
+
+    if batch_summaries is not None and category.safe_title in batch_summaries:
+        batch_summary = batch_summaries[category.safe_title]
+        # batch summary is recorded as any other summary, so saved manifest keeps it for next incremental run
+        if category_manifest is not None:
+            category_manifest.set_summary(category.safe_title, fingerprint, issues, batch_summary)
+        if run_checkpoint is not None:
+            run_checkpoint.set_summary(category.safe_title, fingerprint, batch_summary)
+        if on_fragment is not None and len(batch_summary) > 0:
+            on_fragment(batch_summary)
+        return batch_summary
+    for summary_store in (category_manifest, run_checkpoint):
+        stored_summary = summary_store.get_summary(category.safe_title, fingerprint) if summary_store is not None else None
+        if stored_summary is not None:
+            if category_manifest is not None and summary_store is run_checkpoint:
+                category_manifest.set_summary(category.safe_title, fingerprint, issues, stored_summary)
+            if on_fragment is not None and len(stored_summary) > 0:
+                on_fragment(stored_summary)
+            return stored_summary
+
     category_summarization = summarize_category(category_title=category.safe_title,
-                                                category_labels=category.labels.include if category.labels.include is not None else [],
+                                                category_labels=category_labels,
                                                 change_template=template_model.category_item_change_template,
-                                                issues=issues)
+                                                issues=issues,
+                                                executor=llm_executor,
+                                                on_fragment=on_fragment,
+                                                checkpoint=run_checkpoint.get_category_checkpoint(category.safe_title) if run_checkpoint is not None else None)
+    if category_manifest is not None:
+        category_manifest.set_summary(category.safe_title, fingerprint, issues, category_summarization)
+    if run_checkpoint is not None:
+        run_checkpoint.set_summary(category.safe_title, fingerprint, category_summarization)
     return category_summarization
 
 
@@ -45,6 +93,7 @@ def get_validated_template(template_dict: Dict):
     return template_model
 
 
+@tracing.traced("substitute_identifiers")
 def substitute_identifiers(template: Template, args: Dict[str, str]):
     idenifiers = template.get_identifiers()
     mapping = dict(**args)
@@ -56,21 +105,222 @@ def substitute_identifiers(template: Template, args: Dict[str, str]):
     return template.safe_substitute(**mapping)
 
 
-def create_release_change(template_dict: Dict):
+def split_template(template: Template, split_identifier: str, args: Dict[str, str]) -> Tuple[Optional[str], Optional[str]]:
+    """
+        substitutes the template and splits it at the split identifier into prefix and suffix.
+        returns None, if split identifier is not present exactly once
+    """
+    split_marker = "\x00SPLIT\x00"
+    substituted = substitute_identifiers(template, {**args, split_identifier: split_marker})
+    if substituted.count(split_marker) != 1:
+        return None, None
+    prefix, suffix = substituted.split(split_marker)
+    return prefix, suffix
+
+
+class ReleaseChangeWriter:
+    """
+        writes release change to output artifact progressively.
+        sections are written in template order, fragments of later sections are buffered until earlier sections complete.
+        when write_sections is false, sections are not written and only the release text written with write_release is output.
+    """
+
+    def __init__(self, output_path: Path, section_count: int, write_sections: bool = True):
+        self.write_sections = write_sections
+        self.section_buffers: List[List[Tuple[str, bool]]] = [[] for _ in range(section_count)]
+        self.completed_sections = [False] * section_count
+        self.head_index = 0
+        self.lock = Lock()
+        self.start_time = time.perf_counter()
+        self.first_output_seconds: Optional[float] = None
+        output_path.parent.mkdir(parents=True, exist_ok=True)
+        self.output_path = output_path
+        self.output_file = open(output_path, mode="w", encoding="utf-8")
+
+    def write_out(self, text: str, is_generated: bool):
+        if len(text) == 0:
+            return
+        if is_generated and self.first_output_seconds is None:
+            self.first_output_seconds = time.perf_counter() - self.start_time
+        self.output_file.write(text)
+        self.output_file.flush()
+
+    def write(self, text: str, section_index: Optional[int] = None, is_generated: bool = False):
+        if not self.write_sections:
+            return
+        with self.lock:
+            if section_index is None or section_index == self.head_index:
+                self.write_out(text, is_generated)
+            else:
+                self.section_buffers[section_index].append((text, is_generated))
+
+    def complete_section(self, section_index: int):
+        if not self.write_sections:
+            return
+        with self.lock:
+            self.completed_sections[section_index] = True
+            while self.head_index < len(self.completed_sections) and self.completed_sections[self.head_index]:
+                self.head_index += 1
+                if self.head_index < len(self.completed_sections):
+                    # sections are joined by new line
+                    self.write_out("\n", False)
+                    for buffered_text, is_generated in self.section_buffers[self.head_index]:
+                        self.write_out(buffered_text, is_generated)
+                    self.section_buffers[self.head_index] = []
+
+    def write_release(self, text: str):
+        with self.lock:
+            self.write_out(text, True)
+
+    def close(self):
+        with self.lock:
+            self.output_file.close()
+        first_output_time = f"{self.first_output_seconds:.2f}" if self.first_output_seconds is not None else "NA"
+        print(f"release change is written to {self.output_path}. time to first generated output: {first_output_time} seconds, "
+              f"total time: {time.perf_counter() - self.start_time:.2f} seconds")
+
+
+def get_milestone_args(milestone: MilestoneModel):
+    """
+        milestone identifiers of templates, these take precedence over env values
+    """
+    milestone_args = {"MILESTONE_TITLE": milestone.title}
+    if milestone.number is not None:
+        milestone_args["MILESTONE_NUMBER"] = str(milestone.number)
+    return milestone_args
+
+
+def write_summarized_category_changes(template_model: ReleaseTemplateModel, category: CategoryModel, issues: List[IssueModel], section_index: int,
+                                      writer: ReleaseChangeWriter, llm_executor: Executor, category_manifest: Optional[CategoryManifest] = None,
+                                      milestone_args: Optional[Dict[str, str]] = None, batch_summaries: Optional[Dict[str, str]] = None,
+                                      run_checkpoint: Optional[RunCheckpoint] = None):
+    category_template = Template(template_model.category_template)
+    if len(category.template) > 0:
+        category_template = Template(category.template)
+
+    category_args = {**(milestone_args or {}), "TITLE": category.title}
+    category_prefix, category_suffix = split_template(category_template, "CATEGORY_ITEM_CHANGES", category_args)
+    if category_prefix is None or category_suffix is None:
+        summarized_category_changes = get_summarized_category_changes(template_model, category, issues, llm_executor,
+                                                                      category_manifest=category_manifest, batch_summaries=batch_summaries,
+                                                                      run_checkpoint=run_checkpoint)
+        category_changes = substitute_identifiers(category_template, {**category_args, "CATEGORY_ITEM_CHANGES": summarized_category_changes})
+        writer.write(category_changes, section_index, is_generated=True)
+    else:
+        writer.write(category_prefix, section_index)
+        on_fragment: Optional[Callable[[str], None]] = None
+        if get_env_bool_value("RELEASE_STREAM_OUTPUT", default_value=True):
+            on_fragment = partial(writer.write, section_index=section_index, is_generated=True)
+        summarized_category_changes = get_summarized_category_changes(template_model, category, issues, llm_executor, on_fragment, category_manifest, batch_summaries,
+                                                                      run_checkpoint)
+        if on_fragment is None:
+            writer.write(summarized_category_changes, section_index, is_generated=True)
+        writer.write(category_suffix, section_index)
+        category_changes = category_prefix + summarized_category_changes + category_suffix
+
+    writer.complete_section(section_index)
+    return category_changes
+
+
+def create_release_change(template_dict: Dict, milestone_title: Optional[str] = None, batch_response_path: Optional[Path] = None):
+    """
+        drafts release change of milestone title, or of MILESTONE_TITLE env if not provided.
+        when milestone title is provided, output artifact, manifest and exported output are specific to the milestone.
+        when batch response path is provided, category summaries are taken from batch prediction responses.
+        milestone issues are fetched once and assigned to categories locally, so an issue matching multiple categories is summarized once.
+        category workers prepare prompts and hand over the chunks to llm workers.
+        the category changes are assembled in template order, and are written to output artifact as they are generated.
+        categories unchanged since last draft are reused from category manifest.
+        fetched issues, llm responses and category summaries are checkpointed, so interrupted run can be resumed.
+    """
     template_model = get_validated_template(template_dict)
     all_category_changes: List[str] = []
+    category_concurrency = get_env_int_value("RELEASE_CATEGORY_CONCURRENCY", default_value=3)
+    # worker threads of this release change. in flight calls of process are capped by LLM_MAX_CONCURRENCY of llm rate limiter
+    llm_concurrency = get_env_int_value("RELEASE_LLM_CONCURRENCY", default_value=4)
+    print(f"processing {len(template_model.categories)} categories with category concurrency [{category_concurrency}] and llm concurrency [{llm_concurrency}]")
+    start_time = time.perf_counter()
+
+    output_path = Path(get_optional_env_value("RELEASE_CHANGE_OUTPUT_PATH", str(rootpath/"dist/release_change.md")))
+    output_key = "release_change"
+    if milestone_title is not None:
+        output_path = output_path.with_name(f"{output_path.stem}-{get_safe_name(milestone_title)}{output_path.suffix}")
+        output_key = f"release_change_{get_safe_name(milestone_title)}"
+    category_manifest = create_category_manifest(milestone_title)
+    run_checkpoint = create_run_checkpoint(template_dict, get_summarizer_hash(), milestone_title)
+    stored_issues = run_checkpoint.get_issues()
+    if stored_issues is not None:
+        milestone, category_issues = stored_issues
+    else:
+        milestone, milestone_issues = get_milestone_issues(template_model.category_labels.exclude if template_model.category_labels is not None else [],
+                                                           milestone_title)
+        category_issues = assign_issues_to_categories(template_model, milestone_issues)
+        run_checkpoint.set_issues(milestone, category_issues)
+    calibrate_issue_token_estimator(category_issues)
+    milestone_args = get_milestone_args(milestone)
+    batch_summaries = get_batch_category_summaries(batch_response_path, milestone.title) if batch_response_path is not None else None
+
+    release_template = Template(template_model.template)
+    release_prefix, release_suffix = split_template(release_template, "CATEGORY_CHANGES", milestone_args)
+    # without single CATEGORY_CHANGES identifier, release text can not be written progressively around the sections
+    writer = ReleaseChangeWriter(output_path, len(template_model.categories), write_sections=release_prefix is not None and release_suffix is not None)
+    try:
+        if release_prefix is not None:
+            writer.write(release_prefix)
+
+        with ThreadPoolExecutor(max_workers=category_concurrency, thread_name_prefix="category") as category_executor, \
+                ThreadPoolExecutor(max_workers=llm_concurrency, thread_name_prefix="llm") as llm_executor:
+            category_futures = [category_executor.submit(write_summarized_category_changes, template_model, category, category_issues[section_index],
+                                                         section_index, writer, llm_executor, category_manifest, milestone_args, batch_summaries,
+                                                         run_checkpoint)
+                                for section_index, category in enumerate(template_model.categories)]
+            for category_future in category_futures:
+                all_category_changes.append(category_future.result())
+
+        summarized_release_change = substitute_identifiers(release_template, {**milestone_args, "CATEGORY_CHANGES": "\n".join(all_category_changes)})
+        if release_suffix is not None:
+            writer.write(release_suffix)
+        else:
+            writer.write_release(summarized_release_change)
+    finally:
+        writer.close()
+
+    category_manifest.save()
+    run_checkpoint.print_stats()
+    print(f"summarized all categories of milestone [{milestone.title}] in {time.perf_counter() - start_time:.2f} seconds")
+    export_to_env({output_key: summarized_release_change})
+    return summarized_release_change
+
+
+def create_release_changes(template_dict: Dict, milestone_titles: List[str]):
+    """
+        drafts release changes of milestones concurrently in one process.
+        github client, llm backend, rate limiter and caches are shared by all milestones
+    """
+    milestone_concurrency = get_env_int_value("RELEASE_MILESTONE_CONCURRENCY", default_value=2)
+    print(f"processing {len(milestone_titles)} milestones with milestone concurrency [{milestone_concurrency}]")
+    with ThreadPoolExecutor(max_workers=milestone_concurrency, thread_name_prefix="milestone") as milestone_executor:
+        milestone_futures = [milestone_executor.submit(create_release_change, template_dict, milestone_title) for milestone_title in milestone_titles]
+        for milestone_future in milestone_futures:
+            milestone_future.result()
 
-    for category in template_model.categories:
-        category_template = Template(template_model.category_template)
-        if len(category.template) > 0:
-            category_template = Template(category.template)
 
-        summarized_category_changes = get_summarized_category_changes(template_model, category)
-        category_changes = substitute_identifiers(category_template, {"TITLE": category.title, "CATEGORY_ITEM_CHANGES": summarized_category_changes})
-        all_category_changes.append(category_changes)
+def prepare_release_change_batch(template_dict: Dict):
+    """
+        phase one of batch mode for milestone of MILESTONE_TITLE env. writes batch prediction requests and exits without llm calls
+    """
+    template_model = get_validated_template(template_dict)
+    milestone, milestone_issues = get_milestone_issues(template_model.category_labels.exclude if template_model.category_labels is not None else [])
+    category_issues = assign_issues_to_categories(template_model, milestone_issues)
+    prepare_category_batch(template_model, milestone.title, category_issues)
 
-    summarized_release_change = substitute_identifiers(Template(template_model.template), {"CATEGORY_CHANGES": "\n".join(all_category_changes)})
-    export_to_env({"release_change": summarized_release_change})
+
+def print_run_stats():
+    llm.clear_context_caches()
+    llm.print_stats()
+    get_github_client().print_stats()
+    tracing.write_chrome_trace(Path(get_optional_env_value("RELEASE_TRACE_PATH", str(rootpath/"dist/release_trace.json"))))
+    tracing.print_span_summary()
 
 
 def run_example(example_id: int, run_examples_dict: Dict[int, Callable[[], None]]):
@@ -153,6 +403,8 @@ if __name__ == "__main__":
     example,
     python -m scripts.request.release.draft --generate --template-path .github/release-draft.template.yml
     dotenv -e ..\\.env.releaseNotes.gemini.local -- python -m scripts.request.release.draft --generate --template-path .github/release-draft.template.yml
+    offline llm benchmark,
+    LLM_BACKEND=local LLM_LOCAL_LATENCY_SECONDS=2 LLM_LOCAL_TOKENS_PER_SECOND=50 python -m scripts.request.release.draft --generate --template-path .github/release-notes.template.yml
     """
     parser = ArgumentParser(
         description="Generate Release Change entries")
@@ -162,6 +414,18 @@ if __name__ == "__main__":
                         help="[Required] Provide path to release draft template. Required if not example")
     parser.add_argument("--example", action="store_true", default=False,
                         help="[Optional] to run example and experiments. If provided, generate is not allowed")
+    parser.add_argument("--milestones",
+                        help="[Optional] comma separated milestone titles to draft in one run. default is MILESTONE_TITLE env")
+    parser.add_argument("--batch-prepare", action="store_true", default=False,
+                        help="[Optional] writes category prompts as batch prediction requests to dist/batch directory, unless RELEASE_BATCH_DIR env is provided")
+    parser.add_argument("--batch-responses",
+                        help="[Optional] path of batch prediction responses jsonl. release change is rendered from batch responses")
+    parser.add_argument("--full-regenerate", action="store_true", default=False,
+                        help="[Optional] ignores category manifest and summarizes all categories")
+    parser.add_argument("--resume", action="store_true", default=False,
+                        help="[Optional] resumes interrupted run from checkpoint in dist/checkpoint directory, unless RELEASE_CHECKPOINT_DIR env is provided")
+    parser.add_argument("--debug-prompts", action="store_true", default=False,
+                        help="[Optional] writes full prompts to dist/prompts directory, unless RELEASE_PROMPT_DEBUG_DIR env is provided")
     args = parser.parse_args()
 
     try:
@@ -182,8 +446,31 @@ if __name__ == "__main__":
         parser.print_help()
         exit(1)
 
-    if is_generate:
-        create_release_change(template_dict)
+    if args.full_regenerate:
+        os.environ["RELEASE_INCREMENTAL"] = "false"
+
+    if args.resume:
+        os.environ["RELEASE_RESUME"] = "true"
+
+    if args.debug_prompts and not os.getenv("RELEASE_PROMPT_DEBUG_DIR"):
+        os.environ["RELEASE_PROMPT_DEBUG_DIR"] = str(rootpath/"dist/prompts")
+
+    if is_generate and (args.batch_prepare or args.batch_responses) and args.milestones:
+        print("error: batch mode is not supported with milestones option")
+        parser.print_help()
+        exit(1)
+
+    if is_generate and args.batch_prepare:
+        prepare_release_change_batch(template_dict)
+    elif is_generate and args.batch_responses:
+        create_release_change(template_dict, batch_response_path=Path(args.batch_responses))
+        print_run_stats()
+    elif is_generate:
+        if args.milestones:
+            create_release_changes(template_dict, [title.strip() for title in args.milestones.split(",") if len(title.strip()) > 0])
+        else:
+            create_release_change(template_dict)
+        print_run_stats()
 
     if is_example:
         run_examples()
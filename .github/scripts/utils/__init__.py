@@ -1,4 +1,5 @@
-from .base import is_empty, rootpath
-from .env_util import export_to_env, get_env_value
+from .base import is_empty, get_preview, get_safe_name, rootpath, write_atomic
+from .env_util import export_to_env, get_env_value, get_optional_env_value, get_env_int_value, get_env_bool_value, get_env_float_value
 from .validate import get_valid_dict, get_valid_list, get_parsed_arg_value, get_converted_enum, get_yaml_to_dict
 from .dateutil import get_now, get_preferred_datetime, parse_milestone_dueon, convert_to_human_readable
+from . import tracing
@@ -1,4 +1,6 @@
+import os
 from pathlib import Path
+import tempfile
 
 
 rootpath = Path(__file__).resolve().parents[3]
@@ -6,3 +8,35 @@ rootpath = Path(__file__).resolve().parents[3]
 
 def is_empty(s: str):
     return s is None or len(s.strip()) == 0
+
+
+def get_safe_name(text: str):
+    """
+        text with only alphanumeric chars, usable in file names and output keys
+    """
+    return "".join(c if c.isalnum() else "_" for c in text).strip("_")
+
+
+def get_preview(text: str, max_chars: int):
+    """
+        size bounded preview of text for logs
+    """
+    if len(text) <= max_chars:
+        return text
+    return f"{text[:max_chars]}... [{len(text) - max_chars} more chars]"
+
+
+def write_atomic(file_path: Path, text: str):
+    """
+        file is replaced only after complete write, so an interrupted run or a concurrent reader never sees partial file.
+        temp file is unique per write, concurrent writes of same file must not share it
+    """
+    file_path.parent.mkdir(parents=True, exist_ok=True)
+    temp_fd, temp_name = tempfile.mkstemp(dir=file_path.parent, prefix=f"{file_path.name}.", suffix=".tmp")
+    try:
+        with os.fdopen(temp_fd, mode="w", encoding="utf-8") as f:
+            f.write(text)
+        os.replace(temp_name, file_path)
+    except BaseException:
+        Path(temp_name).unlink(missing_ok=True)
+        raise
@@ -1,6 +1,6 @@
 import os
 from pathlib import Path
-from typing import Dict
+from typing import Dict, Optional
 from .base import rootpath
 
 
@@ -30,3 +30,54 @@ def get_env_value(env_key: str):
         raise ValueError(f"{env_key} env is not provided")
 
     return env_value
+
+
+def get_optional_env_value(env_key: str, default_value: Optional[str] = None):
+    env_value = os.getenv(env_key)
+    if env_value is None or len(env_value.strip()) == 0:
+        return default_value
+
+    return env_value.strip()
+
+
+def get_env_int_value(env_key: str, default_value: int, min_value: int = 1):
+    """
+    reads the env as integer. falls back to default value if not provided.
+    raises error if the value is not a number or is less than min value
+    """
+    env_value = get_optional_env_value(env_key)
+    if env_value is None:
+        return default_value
+    try:
+        int_value = int(env_value)
+    except ValueError:
+        raise ValueError(f"{env_key} env is not a number")
+    if int_value < min_value:
+        raise ValueError(f"{env_key} env must be greater than or equal to {min_value}")
+
+    return int_value
+
+
+def get_env_bool_value(env_key: str, default_value: bool = False):
+    env_value = get_optional_env_value(env_key)
+    if env_value is None:
+        return default_value
+    if env_value.lower() in ["true", "yes", "1", "on"]:
+        return True
+    if env_value.lower() in ["false", "no", "0", "off"]:
+        return False
+    raise ValueError(f"{env_key} env is not a boolean")
+
+
+def get_env_float_value(env_key: str, default_value: float, min_value: float = 0):
+    env_value = get_optional_env_value(env_key)
+    if env_value is None:
+        return default_value
+    try:
+        float_value = float(env_value)
+    except ValueError:
+        raise ValueError(f"{env_key} env is not a number")
+    if float_value < min_value:
+        raise ValueError(f"{env_key} env must be greater than or equal to {min_value}")
+
+    return float_value
@@ -0,0 +1,157 @@
+import codecs
+import json
+from typing import Any, Callable, Iterable, List, Optional, Tuple
+
+
+WHITESPACE_CHARS = " \t\n\r"
+# chars that can follow a complete bare value, e.g. number, true or null
+VALUE_DELIMITER_CHARS = WHITESPACE_CHARS + ",]}"
+json_decoder = json.JSONDecoder()
+
+
+class JsonStreamFrame:
+    def __init__(self, is_object: bool, path: Tuple[str, ...]):
+        self.is_object = is_object
+        self.path = path
+        self.expects_key = is_object
+        self.key: Optional[str] = None
+
+
+class JsonArrayStreamDecoder:
+    """
+        decodes json document from byte chunks. elements of array at array path are decoded one at a time and handed to on_item,
+        so the elements are not held together as dicts. rest of document is kept with the array left empty.
+        array path is the object keys from root, e.g. ("data", "search", "nodes")
+    """
+
+    def __init__(self, array_path: Tuple[str, ...], on_item: Callable[[Any], None]):
+        self.array_path = array_path
+        self.on_item = on_item
+        self.byte_decoder = codecs.getincrementaldecoder("utf-8")()
+        self.buffer = ""
+        self.position = 0
+        self.frames: List[JsonStreamFrame] = []
+        self.is_in_array = False
+        self.skeleton_parts: List[str] = []
+        self.item_count = 0
+
+    def feed(self, chunk: bytes):
+        self.buffer = self.buffer[self.position:] + self.byte_decoder.decode(chunk)
+        self.position = 0
+        self.consume(is_final=False)
+
+    def close(self) -> Any:
+        """
+            returns decoded document without array elements
+        """
+        self.buffer = self.buffer[self.position:] + self.byte_decoder.decode(b"", final=True)
+        self.position = 0
+        self.consume(is_final=True)
+        if len(self.frames) > 0 or self.is_in_array:
+            raise ValueError("json stream is ended before document is complete")
+        return json.loads("".join(self.skeleton_parts))
+
+    def skip_whitespace(self):
+        while self.position < len(self.buffer) and self.buffer[self.position] in WHITESPACE_CHARS:
+            self.position += 1
+
+    def decode_value(self, is_final: bool) -> Optional[Tuple[Any, int]]:
+        """
+            returns value and its end position, or None when buffer doesnt have complete value yet.
+            a bare value may continue in next chunk, e.g. `-2500` of `-2500.0`, so it is complete only when a delimiter follows it
+            or stream is final
+        """
+        try:
+            value, end = json_decoder.raw_decode(self.buffer, self.position)
+        except json.JSONDecodeError:
+            if is_final:
+                raise
+            return None
+        if not is_final and self.buffer[self.position] not in "{[\"" and (end == len(self.buffer) or self.buffer[end] not in VALUE_DELIMITER_CHARS):
+            return None
+        return value, end
+
+    def consume(self, is_final: bool):
+        while True:
+            self.skip_whitespace()
+            if self.position >= len(self.buffer):
+                return
+            if self.is_in_array:
+                if not self.consume_array_item(is_final):
+                    return
+                continue
+            if not self.consume_token(is_final):
+                return
+
+    def consume_array_item(self, is_final: bool):
+        char = self.buffer[self.position]
+        if char == "]":
+            self.is_in_array = False
+            self.skeleton_parts.append("]")
+            self.position += 1
+            self.on_value_end()
+            return True
+        if char == ",":
+            self.position += 1
+            return True
+        decoded = self.decode_value(is_final)
+        if decoded is None:
+            return False
+        item, self.position = decoded
+        self.item_count += 1
+        self.on_item(item)
+        return True
+
+    def consume_token(self, is_final: bool):
+        char = self.buffer[self.position]
+        frame = self.frames[-1] if len(self.frames) > 0 else None
+        if char in "{[":
+            path = frame.path + (frame.key,) if frame is not None and frame.is_object else (frame.path if frame is not None else ())
+            is_array_path = char == "[" and path == self.array_path and all(fr.is_object for fr in self.frames)
+            self.skeleton_parts.append(char)
+            self.position += 1
+            if is_array_path:
+                self.is_in_array = True
+            else:
+                self.frames.append(JsonStreamFrame(is_object=char == "{", path=path))
+            return True
+        if char in "}]":
+            self.frames.pop()
+            self.skeleton_parts.append(char)
+            self.position += 1
+            self.on_value_end()
+            return True
+        if char in ",:":
+            if char == "," and frame is not None and frame.is_object:
+                frame.expects_key = True
+            self.skeleton_parts.append(char)
+            self.position += 1
+            return True
+
+        decoded = self.decode_value(is_final)
+        if decoded is None:
+            return False
+        value, end = decoded
+        self.skeleton_parts.append(self.buffer[self.position:end])
+        self.position = end
+        if frame is not None and frame.expects_key:
+            frame.key = value
+            frame.expects_key = False
+        else:
+            self.on_value_end()
+        return True
+
+    def on_value_end(self):
+        # key of object is reset after its value, so nested path is not matched with stale key
+        if len(self.frames) > 0 and self.frames[-1].is_object:
+            self.frames[-1].key = None
+
+
+def decode_json_stream(chunks: Iterable[bytes], array_path: Tuple[str, ...], on_item: Callable[[Any], None]):
+    """
+        returns decoded document with array at array path left empty, and count of array elements handed to on_item
+    """
+    decoder = JsonArrayStreamDecoder(array_path, on_item)
+    for chunk in chunks:
+        decoder.feed(chunk)
+    return decoder.close(), decoder.item_count
@@ -0,0 +1,30 @@
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+import tempfile
+import unittest
+from .base import write_atomic
+
+
+class WriteAtomicTest(unittest.TestCase):
+
+    def test_concurrent_writes_leave_one_complete_file(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            file_path = Path(temp_dir)/"nested"/"state.json"
+            texts = [str(ind) * 100000 for ind in range(8)]
+            with ThreadPoolExecutor(max_workers=8) as executor:
+                list(executor.map(lambda text: write_atomic(file_path, text), texts))
+            self.assertIn(file_path.read_text(encoding="utf-8"), texts)
+            self.assertEqual([path.name for path in file_path.parent.iterdir()], ["state.json"])
+
+    def test_failed_write_keeps_old_file(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            file_path = Path(temp_dir)/"state.json"
+            write_atomic(file_path, "old")
+            with self.assertRaises(UnicodeEncodeError):
+                write_atomic(file_path, "new \ud800")
+            self.assertEqual(file_path.read_text(encoding="utf-8"), "old")
+            self.assertEqual([path.name for path in file_path.parent.iterdir()], ["state.json"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,85 @@
+import json
+import random
+import unittest
+from typing import Any, List
+from .json_stream import decode_json_stream
+
+
+ARRAY_PATH = ("data", "search", "nodes")
+
+
+def get_chunks(data: bytes, chunk_sizes: List[int]):
+    position = 0
+    chunk_index = 0
+    while position < len(data):
+        chunk_size = chunk_sizes[chunk_index % len(chunk_sizes)]
+        yield data[position:position + chunk_size]
+        position += chunk_size
+        chunk_index += 1
+
+
+def get_random_value(rand: random.Random, depth: int = 0) -> Any:
+    value_kind = rand.choice(["int", "float", "exp", "bool", "null", "str"] + (["list", "dict"] if depth < 3 else []))
+    if value_kind == "int":
+        return rand.randint(-10**6, 10**6)
+    if value_kind == "float":
+        return round(rand.uniform(-10**4, 10**4), rand.randint(0, 4))
+    if value_kind == "exp":
+        return rand.uniform(-1, 1) * 10 ** rand.randint(-30, 30)
+    if value_kind == "bool":
+        return rand.choice([True, False])
+    if value_kind == "null":
+        return None
+    if value_kind == "str":
+        return "".join(rand.choice("ab \"\\/\n\té€😀") for _ in range(rand.randint(0, 8)))
+    if value_kind == "list":
+        return [get_random_value(rand, depth + 1) for _ in range(rand.randint(0, 4))]
+    return {f"k{ind}": get_random_value(rand, depth + 1) for ind in range(rand.randint(0, 4))}
+
+
+def get_random_document(rand: random.Random):
+    return {"data": {"search": {"issueCount": rand.randint(0, 5000),
+                                "nodes": [get_random_value(rand) for _ in range(rand.randint(0, 6))],
+                                "pageInfo": {"hasNextPage": rand.choice([True, False]), "endCursor": get_random_value(rand)}},
+                     "rateLimit": {"cost": rand.uniform(0, 10), "remaining": rand.randint(0, 5000)}}}
+
+
+class JsonStreamDecodeTest(unittest.TestCase):
+
+    def assert_decoded(self, data: bytes, chunk_sizes: List[int]):
+        items: List[Any] = []
+        document, item_count = decode_json_stream(get_chunks(data, chunk_sizes), ARRAY_PATH, items.append)
+        expected_document = json.loads(data)
+        expected_items = expected_document["data"]["search"]["nodes"]
+        expected_document["data"]["search"]["nodes"] = []
+        self.assertEqual(items, expected_items, f"chunk sizes {chunk_sizes}")
+        self.assertEqual(item_count, len(expected_items))
+        self.assertEqual(document, expected_document, f"chunk sizes {chunk_sizes}")
+
+    def test_number_split_across_chunks(self):
+        data = b'{"data":{"search":{"nodes":[-2500.0]}}}'
+        for chunk_size in range(1, len(data) + 1):
+            self.assert_decoded(data, [chunk_size])
+
+    def test_bare_values_split_across_chunks(self):
+        data = b'{"data":{"search":{"nodes":[1e-7, 12.5E+3 ,true,false, null,-0]},"total":1.25e2}}'
+        for chunk_size in range(1, len(data) + 1):
+            self.assert_decoded(data, [chunk_size])
+
+    def test_random_chunking(self):
+        rand = random.Random(20261019)
+        for _ in range(300):
+            document = get_random_document(rand)
+            indent = rand.choice([None, 0, 2])
+            data = json.dumps(document, indent=indent, ensure_ascii=rand.choice([True, False])).encode("utf-8")
+            chunk_sizes = [rand.randint(1, 16) for _ in range(rand.randint(1, 8))]
+            self.assert_decoded(data, chunk_sizes)
+
+    def test_incomplete_document_is_error(self):
+        data = b'{"data":{"search":{"nodes":[1, 2'
+        with self.assertRaises(ValueError):
+            decode_json_stream(get_chunks(data, [3]), ARRAY_PATH, lambda item: None)
+
+
+if __name__ == "__main__":
+    unittest.main()
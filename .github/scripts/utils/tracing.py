@@ -0,0 +1,176 @@
+from contextlib import contextmanager
+from functools import wraps
+import json
+import os
+from pathlib import Path
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, TypeVar
+from pydantic import BaseModel
+
+
+# Result Type
+RT = TypeVar("RT")
+
+
+class SpanModel(BaseModel):
+    name: str
+    start_us: float
+    duration_us: float
+    thread_id: int
+    thread_name: str
+    attributes: Dict[str, Any]
+
+
+trace_start_time = time.perf_counter()
+span_records: List[SpanModel] = []
+span_records_lock = threading.Lock()
+active_spans = threading.local()
+# attributes of a span can be updated from worker threads it is attached to
+span_attributes_lock = threading.Lock()
+
+
+def get_active_span_stack() -> List[Dict[str, Any]]:
+    if not hasattr(active_spans, "stack"):
+        active_spans.stack = []
+    return active_spans.stack
+
+
+@contextmanager
+def span(name: str, **attributes: Any):
+    """
+        records wall time of the block along with attributes.
+        yields attributes dict, so the block can add attributes like bytes and tokens
+    """
+    span_attributes: Dict[str, Any] = dict(attributes)
+    span_stack = get_active_span_stack()
+    span_stack.append(span_attributes)
+    start_time = time.perf_counter()
+    try:
+        yield span_attributes
+    finally:
+        end_time = time.perf_counter()
+        span_stack.pop()
+        current_thread = threading.current_thread()
+        with span_attributes_lock:
+            span_record = SpanModel(name=name,
+                                    start_us=(start_time - trace_start_time) * 1e6,
+                                    duration_us=(end_time - start_time) * 1e6,
+                                    thread_id=current_thread.native_id or 0,
+                                    thread_name=current_thread.name,
+                                    attributes=dict(span_attributes))
+        with span_records_lock:
+            span_records.append(span_record)
+
+
+def get_active_span_attributes() -> Optional[Dict[str, Any]]:
+    """
+        attributes of innermost active span of current thread, None if there is no active span
+    """
+    span_stack = get_active_span_stack()
+    return span_stack[-1] if len(span_stack) > 0 else None
+
+
+@contextmanager
+def attached_span(span_attributes: Optional[Dict[str, Any]]):
+    """
+        makes span of other thread the innermost active span of current thread in the block, so worker thread attributes
+        like retries are added to the span of submitting thread. the span is not recorded again
+    """
+    if span_attributes is None:
+        yield
+        return
+    span_stack = get_active_span_stack()
+    span_stack.append(span_attributes)
+    try:
+        yield
+    finally:
+        span_stack.pop()
+
+
+def traced(name: str):
+    """
+        decorator to record the function call as span
+    """
+    def decorator(func: Callable[..., RT]) -> Callable[..., RT]:
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def add_span_attributes(**attributes: Any):
+    """
+        adds attributes to innermost active span of current thread. no-op if there is no active span
+    """
+    span_stack = get_active_span_stack()
+    if len(span_stack) > 0:
+        with span_attributes_lock:
+            span_stack[-1].update(attributes)
+
+
+def increment_span_attribute(key: str, amount: int = 1):
+    span_stack = get_active_span_stack()
+    if len(span_stack) > 0:
+        with span_attributes_lock:
+            span_stack[-1][key] = span_stack[-1].get(key, 0) + amount
+
+
+def write_chrome_trace(trace_path: Path):
+    """
+        writes spans in chrome trace event format, viewable in chrome://tracing or perfetto
+    """
+    process_id = os.getpid()
+    with span_records_lock:
+        records = list(span_records)
+    trace_events: List[Dict[str, Any]] = []
+    thread_names = {}
+    for record in records:
+        thread_names[record.thread_id] = record.thread_name
+        trace_events.append({
+            "name": record.name,
+            "cat": record.name.split(".")[0],
+            "ph": "X",
+            "ts": round(record.start_us, 3),
+            "dur": round(record.duration_us, 3),
+            "pid": process_id,
+            "tid": record.thread_id,
+            "args": record.attributes
+        })
+    for thread_id, thread_name in thread_names.items():
+        trace_events.append({"name": "thread_name", "ph": "M", "pid": process_id, "tid": thread_id, "args": {"name": thread_name}})
+
+    trace_path.parent.mkdir(parents=True, exist_ok=True)
+    with open(trace_path, mode="w", encoding="utf-8") as f:
+        json.dump({"traceEvents": trace_events, "displayTimeUnit": "ms"}, f, default=str)
+    print(f"trace of {len(records)} spans is written to {trace_path}")
+
+
+def get_numeric_attribute(record: SpanModel, key: str):
+    value = record.attributes.get(key)
+    return value if isinstance(value, (int, float)) and not isinstance(value, bool) else 0
+
+
+def print_span_summary():
+    """
+        prints one line per span name with count, total and max wall time, bytes, tokens and retries
+    """
+    with span_records_lock:
+        records = list(span_records)
+    summary: Dict[str, Dict[str, float]] = {}
+    for record in records:
+        name_summary = summary.setdefault(record.name, {"count": 0, "total": 0, "max": 0, "bytes": 0, "tokens": 0, "retries": 0})
+        duration_seconds = record.duration_us / 1e6
+        name_summary["count"] += 1
+        name_summary["total"] += duration_seconds
+        name_summary["max"] = max(name_summary["max"], duration_seconds)
+        name_summary["bytes"] += get_numeric_attribute(record, "bytes")
+        name_summary["tokens"] += get_numeric_attribute(record, "prompt_tokens") + get_numeric_attribute(record, "output_tokens")
+        name_summary["retries"] += get_numeric_attribute(record, "retries")
+
+    print(f"{'stage':<40} {'count':>6} {'total(s)':>9} {'max(s)':>8} {'bytes':>10} {'tokens':>8} {'retries':>7}")
+    for name, name_summary in summary.items():
+        print(f"{name:<40} {name_summary['count']:>6.0f} {name_summary['total']:>9.2f} {name_summary['max']:>8.2f} "
+              f"{name_summary['bytes']:>10.0f} {name_summary['tokens']:>8.0f} {name_summary['retries']:>7.0f}")